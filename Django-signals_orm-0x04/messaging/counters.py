@@ -0,0 +1,126 @@
+# Denormalized per-user unread counters (UnreadCounter), with a cache in front
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import Message, Notification, UnreadCounter
+
+DEFAULTS = {
+    "CACHE": True,           # keep counts in the Django cache as well
+    "CACHE_TIMEOUT": 300,    # seconds; changes invalidate the entry anyway
+}
+
+
+def counter_settings():
+    """DEFAULTS overridden by settings.MESSAGING_UNREAD."""
+    return {**DEFAULTS, **getattr(settings, "MESSAGING_UNREAD", {})}
+
+
+def cache_key(user_id):
+    return f"messaging:unread:{user_id}"
+
+
+def _invalidate(user_id):
+    if counter_settings()["CACHE"]:
+        key = cache_key(user_id)
+        cache.delete(key)
+        # a concurrent reader may cache the pre-commit value in between
+        transaction.on_commit(lambda: cache.delete(key))
+
+
+def bump(user_id, messages=0, notifications=0):
+    """
+    Add to a user's counters in place (F() update, no read), never going
+    below 0. Users without a counter row are skipped: get_counts() seeds
+    the row from the real counts on first read, which already include
+    this change.
+    """
+    if not (messages or notifications):
+        return
+    UnreadCounter.objects.filter(user_id=user_id).update(
+        messages=Greatest(F("messages") + messages, 0),
+        notifications=Greatest(F("notifications") + notifications, 0),
+    )
+    _invalidate(user_id)
+
+
+def actual_counts(user_ids):
+    """{user_id: (unread messages, unread notifications)} from COUNT queries."""
+    counts = {user_id: [0, 0] for user_id in user_ids}
+    for user_id, n in (Message.objects.filter(receiver_id__in=user_ids, read=False)
+                       .values_list("receiver_id").annotate(n=Count("pk")).order_by()):
+        counts[user_id][0] = n
+    for user_id, n in (Notification.objects.filter(user_id__in=user_ids, read=False)
+                       .values_list("user_id").annotate(n=Count("pk")).order_by()):
+        counts[user_id][1] = n
+    return {user_id: tuple(pair) for user_id, pair in counts.items()}
+
+
+def reconcile_users(user_ids):
+    """Overwrite the counters of `user_ids` with their real counts; returns repairs."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    actual = actual_counts(user_ids)
+    stored = UnreadCounter.objects.in_bulk(user_ids)
+    missing = set(user_ids) - set(stored)
+    if missing:
+        # e.g. a user whose row is being deleted right now
+        missing = set(User.objects.filter(pk__in=missing).values_list("pk", flat=True))
+    fix, create = [], []
+    for user_id, (messages, notifications) in actual.items():
+        counter = stored.get(user_id)
+        if counter is None:
+            if user_id not in missing:
+                continue
+            create.append(UnreadCounter(user_id=user_id, messages=messages,
+                                        notifications=notifications))
+        elif (counter.messages, counter.notifications) != (messages, notifications):
+            counter.messages, counter.notifications = messages, notifications
+            fix.append(counter)
+    with transaction.atomic():
+        UnreadCounter.objects.bulk_update(fix, ["messages", "notifications"])
+        UnreadCounter.objects.bulk_create(create, ignore_conflicts=True)
+    for counter in fix + create:
+        _invalidate(counter.user_id)
+    return len(fix) + len(create)
+
+
+def reconcile(chunk_size=1000):
+    """
+    Repair drift for every user, `chunk_size` users at a time (e.g. from a
+    periodic job). Drift comes from writes that bypass the signals, such
+    as QuerySet.update(read=True). Returns {"checked": n, "repaired": n}.
+    """
+    checked = repaired = 0
+    last_pk = 0
+    while True:
+        ids = list(User.objects.filter(pk__gt=last_pk).order_by("pk")
+                   .values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return {"checked": checked, "repaired": repaired}
+        repaired += reconcile_users(ids)
+        checked += len(ids)
+        last_pk = ids[-1]
+
+
+def get_counts(user_id):
+    """{"messages": n, "notifications": n}: cache, then the counter row."""
+    options = counter_settings()
+    key = cache_key(user_id)
+    if options["CACHE"]:
+        counts = cache.get(key)
+        if counts is not None:
+            return counts
+    counter = UnreadCounter.objects.filter(user_id=user_id).first()
+    if counter is None:
+        reconcile_users([user_id])
+        counter = UnreadCounter.objects.get(user_id=user_id)
+    counts = {"messages": counter.messages, "notifications": counter.notifications}
+    if options["CACHE"]:
+        cache.set(key, counts, options["CACHE_TIMEOUT"])
+    return counts
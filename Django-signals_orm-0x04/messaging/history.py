@@ -0,0 +1,46 @@
+# Batched MessageHistory writes for log_message_edit
+
+import threading
+from contextlib import contextmanager
+
+from .models import MessageHistory
+
+_local = threading.local()
+
+
+def record_history(entry):
+    """Save a MessageHistory row now, or queue it inside history_batch()."""
+    pending = getattr(_local, "pending", None)
+    if pending is None:
+        entry.save()
+    else:
+        pending.append(entry)
+
+
+@contextmanager
+def history_batch(batch_size=500):
+    """
+    Collect the history rows written by edits in this block and insert
+    them with bulk_create when it exits. Use it inside the transaction
+    that edits the messages, so the history commits or rolls back with it:
+
+        with transaction.atomic(), history_batch():
+            for message in messages:
+                message.content = redact(message.content)
+                message.save()
+
+    Nested blocks join the outermost one. Rows are discarded if the block
+    raises.
+    """
+    if getattr(_local, "pending", None) is not None:
+        yield
+        return
+    _local.pending = []
+    try:
+        yield
+    except BaseException:
+        _local.pending = None
+        raise
+    pending, _local.pending = _local.pending, None
+    if pending:
+        MessageHistory.objects.bulk_create(pending, batch_size=batch_size)
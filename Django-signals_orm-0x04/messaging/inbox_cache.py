@@ -0,0 +1,124 @@
+# Per-user, versioned inbox cache for cached_conversation
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULTS = {
+    "TIMEOUT": 3600,   # seconds an inbox entry may live; changes replace it sooner
+}
+
+
+def inbox_settings():
+    """DEFAULTS overridden by settings.MESSAGING_INBOX_CACHE."""
+    return {**DEFAULTS, **getattr(settings, "MESSAGING_INBOX_CACHE", {})}
+
+
+def _version_key(user_id):
+    return f"messaging:inbox:version:{user_id}"
+
+
+def _data_key(user_id, version):
+    return f"messaging:inbox:{user_id}:{version}"
+
+
+def _new_version():
+    # Time-based, so a version key lost to eviction can't come back as an
+    # old number and resurrect a stale entry.
+    return time.time_ns()
+
+
+def get_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    cache.set(_version_key(user_id), _new_version(), None)
+
+
+def invalidate(user_id):
+    """
+    Move the user's inbox to a new version. Done again after commit, so a
+    request that rebuilt from pre-commit data can't keep it current.
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def _bump_many(user_ids):
+    version = _new_version()
+    cache.set_many({_version_key(user_id): version for user_id in user_ids}, None)
+
+
+def invalidate_many(user_ids):
+    """invalidate() for many users: one set_many now, one after commit."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _bump_many(user_ids)
+    transaction.on_commit(lambda: _bump_many(user_ids))
+
+
+class InboxStats:
+    """Process-wide hit/miss and rebuild-time numbers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.rebuild_seconds = 0.0
+            self.rebuild_max = 0.0
+
+    def record(self, hit, rebuild_seconds=0.0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                return
+            self.misses += 1
+            self.rebuild_seconds += rebuild_seconds
+            self.rebuild_max = max(self.rebuild_max, rebuild_seconds)
+
+    def as_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "rebuild_avg_ms": self.rebuild_seconds / self.misses * 1e3 if self.misses else 0.0,
+                "rebuild_max_ms": self.rebuild_max * 1e3,
+            }
+
+
+stats = InboxStats()
+
+
+def get_inbox(user_id, loader):
+    """
+    Return (rows, hit, rebuild_seconds): the cached inbox rows for the
+    user's current version, or loader() stored under that version.
+    `loader` must return picklable data (plain dicts), not querysets.
+    """
+    key = _data_key(user_id, get_version(user_id))
+    rows = cache.get(key)
+    if rows is not None:
+        stats.record(True)
+        return rows, True, 0.0
+    started = time.perf_counter()
+    rows = loader()
+    elapsed = time.perf_counter() - started
+    cache.set(key, rows, inbox_settings()["TIMEOUT"])
+    stats.record(False, elapsed)
+    return rows, False, elapsed
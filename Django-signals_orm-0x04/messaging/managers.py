@@ -2,6 +2,8 @@
 
 from django.db import models
 
+from . import inbox_cache
+
 
 class UnreadMessagesManager(models.Manager):
     def unread_for_user(self, user):
@@ -15,3 +17,41 @@ class UnreadMessagesManager(models.Manager):
             .filter(receiver=user, read=False)
             .only("id", "sender", "receiver", "content", "timestamp")
         )
+
+    def unread_count(self, user):
+        """Unread message count from the user's counter row (no COUNT(*))."""
+        from .counters import get_counts
+
+        return get_counts(user.pk)["messages"]
+
+    def mark_read(self, user, message_ids=None):
+        """Mark the user's unread messages (or just `message_ids`) read."""
+        from .counters import bump
+
+        unread = super().get_queryset().filter(receiver=user, read=False)
+        if message_ids is not None:
+            unread = unread.filter(pk__in=message_ids)
+        updated = unread.update(read=True)
+        bump(user.pk, messages=-updated)
+        inbox_cache.invalidate(user.pk)
+        return updated
+
+
+class NotificationManager(models.Manager):
+    def unread_count(self, user):
+        """Unread notification count from the user's counter row."""
+        from .counters import get_counts
+
+        return get_counts(user.pk)["notifications"]
+
+    def mark_read(self, user, notification_ids=None):
+        """Mark the user's unread notifications (or just the given ids) read."""
+        from .counters import bump
+
+        unread = self.get_queryset().filter(user=user, read=False)
+        if notification_ids is not None:
+            unread = unread.filter(pk__in=notification_ids)
+        updated = unread.update(read=True)
+        bump(user.pk, notifications=-updated)
+        inbox_cache.invalidate(user.pk)
+        return updated
@@ -1,31 +1,65 @@
 # ALX Task 4: Custom ORM Manager for unread messages with .only() optimization
 
-from .managers import UnreadMessagesManager
-from django.db import models
+from collections import defaultdict
+
+from .managers import NotificationManager, UnreadMessagesManager
+from django.db import connection, models
 from django.contrib.auth.models import User
 
 
 # ------------------------------------------
-# CUSTOM MANAGER REQUIRED BY ALX
+# CHANGE TRACKING BASE
 # ------------------------------------------
-class UnreadMessagesManager(models.Manager):
-    def unread_for_user(self, user):
-        """
-        Returns unread messages for a specific user.
-        Optimized with .only() to load minimal fields.
-        """
-        return (
-            super()
-            .get_queryset()
-            .filter(receiver=user, read=False)
-            .only("id", "sender", "receiver", "content", "timestamp")
+class TrackedModel(models.Model):
+    """
+    Keeps the field values as last loaded from / saved to the database, so
+    signals can see what changed without a SELECT.
+    """
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot()
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is not None:
+            fields = {self._meta.get_field(name).attname for name in fields
+                      if name != "pk"} | ({self._meta.pk.attname} if "pk" in fields else set())
+        self._snapshot(fields)
+
+    def _snapshot(self, attnames=None):
+        """Record the current values of loaded fields (`attnames` only, if given)."""
+        deferred = self.get_deferred_fields()
+        snapshot = getattr(self, "_loaded_values", {})
+        snapshot.update(
+            (field.attname, getattr(self, field.attname))
+            for field in self._meta.concrete_fields
+            if field.attname not in deferred
+            and (attnames is None or field.attname in attnames)
         )
+        self._loaded_values = snapshot
+
+    def loaded_value(self, attname, default=None):
+        """`attname`'s value as of the last load or save (default if unknown)."""
+        return getattr(self, "_loaded_values", {}).get(attname, default)
+
+    def has_loaded_value(self, attname):
+        return attname in getattr(self, "_loaded_values", {})
 
 
 # ------------------------------------------
 # MESSAGE MODEL (includes read + parent_message + edited)
 # ------------------------------------------
-class Message(models.Model):
+class Message(TrackedModel):
     sender = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="sent_messages"
     )
@@ -54,6 +88,23 @@ class Message(models.Model):
     objects = models.Manager()              # Django default
     unread = UnreadMessagesManager()        # ALX Task 4 manager
 
+    class Meta:
+        indexes = [
+            # inbox: unread_for_user(), ordered newest first. Partial rather
+            # than (receiver, read, -timestamp): Django filters read=False
+            # as NOT "read", which SQLite can't match to an index column
+            # but does match to this index's identical WHERE clause.
+            models.Index(
+                fields=["receiver", "-timestamp"],
+                condition=models.Q(read=False),
+                name="msg_unread_recv_ts_idx",
+            ),
+            # inbox: all received messages, newest first (cached_conversation)
+            models.Index(fields=["receiver", "-timestamp"], name="msg_recv_ts_idx"),
+            # thread loading: replies to a message in timestamp order
+            models.Index(fields=["parent_message", "timestamp"], name="msg_parent_ts_idx"),
+        ]
+
     def __str__(self):
         return f"Message {self.pk} from {self.sender} to {self.receiver}"
 
@@ -61,15 +112,40 @@ class Message(models.Model):
     # Task 3: Recursive fetch of replies
     # ------------------------------------------
     def get_all_replies(self):
-        all_replies = []
+        """
+        Returns every reply below this message, depth-first, with siblings
+        in timestamp order.
 
-        def collect(node):
-            children = node.replies.all()
-            for child in children:
-                all_replies.append(child)
-                collect(child)
+        The whole subtree is loaded by one recursive CTE query and linked
+        up in memory: each reply gets a `depth` attribute (1 = direct
+        reply), and the `replies` / `parent_message` caches are filled in,
+        so walking `reply.replies.all()` afterwards runs no queries.
+        """
+        qn = connection.ops.quote_name
+        table = qn(Message._meta.db_table)
+        pk = qn(Message._meta.pk.column)
+        parent = qn(Message._meta.get_field("parent_message").column)
+        sql = (
+            f"WITH RECURSIVE thread AS ("
+            f" SELECT m.*, 1 AS depth FROM {table} m WHERE m.{parent} = %s"
+            f" UNION ALL"
+            f" SELECT m.*, thread.depth + 1 FROM {table} m"
+            f" JOIN thread ON m.{parent} = thread.{pk}"
+            f") SELECT * FROM thread"
+        )
+        children = defaultdict(list)
+        for reply in Message.objects.raw(sql, [self.pk]):
+            children[reply.parent_message_id].append(reply)
 
-        collect(self)
+        all_replies = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node is not self:
+                all_replies.append(node)
+            kids = sorted(children.get(node.pk, ()), key=lambda m: (m.timestamp, m.pk))
+            _cache_replies(node, kids)
+            stack.extend(reversed(kids))
         return all_replies
 
     @staticmethod
@@ -82,6 +158,16 @@ class Message(models.Model):
         )
 
 
+def _cache_replies(node, kids):
+    """Fill node.replies.all() (and each kid's parent_message) from memory."""
+    replies = node.replies.all()
+    replies._result_cache = kids
+    replies._prefetch_done = True
+    node.__dict__.setdefault("_prefetched_objects_cache", {})["replies"] = replies
+    for kid in kids:
+        Message.parent_message.field.set_cached_value(kid, node)
+
+
 # ------------------------------------------
 # MESSAGE HISTORY (Task 1 requirement)
 # ------------------------------------------
@@ -97,6 +183,11 @@ class MessageHistory(models.Model):
         User, on_delete=models.SET_NULL, null=True, blank=True
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["message", "edited_at"], name="hist_msg_edited_idx"),
+        ]
+
     def __str__(self):
         return f"History of message {self.message_id} at {self.edited_at}"
 
@@ -104,7 +195,7 @@ class MessageHistory(models.Model):
 # ------------------------------------------
 # NOTIFICATIONS (Task 0)
 # ------------------------------------------
-class Notification(models.Model):
+class Notification(TrackedModel):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="notifications"
     )
@@ -114,5 +205,84 @@ class Notification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    objects = NotificationManager()
+
+    class Meta:
+        indexes = [
+            # unread notifications per user (partial, see Message.Meta)
+            models.Index(
+                fields=["user", "-created_at"],
+                condition=models.Q(read=False),
+                name="notif_unread_user_idx",
+            ),
+        ]
+
     def __str__(self):
         return f"Notification for {self.user} about message {self.message_id}"
+
+
+# ------------------------------------------
+# DENORMALIZED UNREAD COUNTERS (see counters.py)
+# ------------------------------------------
+class UnreadCounter(models.Model):
+    """
+    Per-user unread message / notification counts, kept up to date by the
+    messaging signals so badges don't need COUNT(*) queries.
+    """
+
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True, related_name="unread_counter"
+    )
+    messages = models.IntegerField(default=0)
+    notifications = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Unread for user {self.user_id}: {self.messages} messages, {self.notifications} notifications"
+
+
+# ------------------------------------------
+# USER DATA PURGE JOBS (see purge.py)
+# ------------------------------------------
+class PurgeJob(models.Model):
+    """
+    Progress of one chunked purge of a user's messaging data. Each chunk
+    commits together with the job row, so a crashed purge resumes from
+    `stage` / `last_pk`.
+    """
+
+    STAGES = ("notifications", "messages", "history", "user", "done")
+
+    # plain id, not a FK: the job outlives the user row
+    user_id = models.BigIntegerField(unique=True)
+    stage = models.CharField(max_length=20, default="notifications")
+    last_pk = models.BigIntegerField(default=0)
+    notifications_deleted = models.PositiveIntegerField(default=0)
+    messages_deleted = models.PositiveIntegerField(default=0)
+    history_cleared = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Purge of user {self.user_id} ({self.stage})"
+
+    @property
+    def done(self):
+        return self.stage == "done"
+
+    @property
+    def failed(self):
+        """The last run stopped on an error (see `error`); it can be resumed."""
+        return bool(self.error) and not self.done
+
+    def progress(self):
+        return {
+            "user_id": self.user_id,
+            "stage": self.stage,
+            "notifications_deleted": self.notifications_deleted,
+            "messages_deleted": self.messages_deleted,
+            "history_cleared": self.history_cleared,
+            "failed": self.failed,
+            "error": self.error,
+        }
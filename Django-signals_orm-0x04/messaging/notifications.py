@@ -0,0 +1,267 @@
+# Deferred, batched notification fan-out for create_notification_on_message
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import inbox_cache
+from .counters import bump
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "deferred",      # "deferred" (background bulk_create) or "sync"
+    "BATCH_SIZE": 500,       # rows per bulk_create
+    "MAX_LATENCY": 0.05,     # seconds a queued notification may wait for a batch
+    "WORKERS": 2,
+    "MAX_PENDING": 10000,    # queue bound; beyond it producers wait...
+    "PUT_TIMEOUT": 0.1,      # ...this long, then insert synchronously
+    "RETRIES": 3,            # further attempts for a batch that failed to write
+    "RETRY_BACKOFF": 0.05,   # seconds before the first retry, doubled each time
+}
+
+
+def notification_settings():
+    """DEFAULTS overridden by settings.MESSAGING_NOTIFICATIONS."""
+    return {**DEFAULTS, **getattr(settings, "MESSAGING_NOTIFICATIONS", {})}
+
+
+class NotificationDispatcher:
+    """
+    Buffers (user_id, message_id) pairs and writes them as Notification rows
+    with bulk_create from a small pool of worker threads.
+
+    A batch is written when it reaches `batch_size` rows or its oldest row
+    has waited `max_latency` seconds. The queue holds at most `max_pending`
+    rows; a full queue makes producers wait up to `put_timeout` and then
+    insert their row themselves, so nothing is dropped. stats() reports the
+    queue depth and how often that backpressure kicked in.
+
+    A batch that fails to write is retried `retries` times with
+    exponential backoff. If it still fails, its rows are written one by
+    one, so a single bad row (e.g. its message was deleted meanwhile)
+    only loses itself; those rows are logged and counted in `dropped`.
+
+    With workers=0 no threads are started and flush() writes the queued
+    rows in the calling thread.
+    """
+
+    _STOP = object()
+
+    def __init__(self, batch_size=500, max_latency=0.05, workers=2,
+                 max_pending=10000, put_timeout=0.1, retries=3, retry_backoff=0.05):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._queue = queue.Queue(max_pending)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.full_waits = 0
+        self.overflow_sync = 0
+        self.errors = 0
+        self.retried = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.flush_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls):
+        options = notification_settings()
+        return cls(batch_size=options["BATCH_SIZE"],
+                   max_latency=options["MAX_LATENCY"],
+                   workers=options["WORKERS"],
+                   max_pending=options["MAX_PENDING"],
+                   put_timeout=options["PUT_TIMEOUT"],
+                   retries=options["RETRIES"],
+                   retry_backoff=options["RETRY_BACKOFF"])
+
+    def submit(self, user_id, message_id):
+        """Queue one notification; called after the message's transaction commits."""
+        if not self._threads and self.workers:
+            self._start()
+        item = (user_id, message_id)
+        with self._lock:
+            self.submitted += 1
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.full_waits += 1
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                with self._lock:
+                    self.overflow_sync += 1
+                self._write([item])
+                return
+        depth = self._queue.qsize()
+        with self._lock:
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, daemon=True,
+                                          name=f"notification-dispatch-{i}")
+                thread.start()
+                self._threads.append(thread)
+        atexit.register(self.close)
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    self._queue.task_done()
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.max_latency
+                stop = False
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if item is self._STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                try:
+                    self._write(batch)
+                finally:
+                    for _ in range(len(batch) + stop):
+                        self._queue.task_done()
+                if stop:
+                    return
+        finally:
+            # Each worker thread has its own DB connection.
+            connection.close()
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        delay = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert(batch)
+                break
+            except Exception:
+                logger.exception("failed to write %d notifications (attempt %d of %d)",
+                                 len(batch), attempt + 1, self.retries + 1)
+                with self._lock:
+                    self.errors += 1
+                # a broken connection would fail every retry the same way
+                if not connection.in_atomic_block:
+                    connection.close_if_unusable_or_obsolete()
+                if attempt < self.retries:
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(delay)
+                    delay *= 2
+        else:
+            written = 0
+            for item in batch:
+                try:
+                    self._insert([item])
+                    written += 1
+                except Exception:
+                    logger.exception("dropping notification for user %s, message %s", *item)
+                    with self._lock:
+                        self.dropped += 1
+            with self._lock:
+                self.written += written
+                self.flush_seconds += time.perf_counter() - started
+            return
+        with self._lock:
+            self.written += len(batch)
+            self.batches += 1
+            self.flush_seconds += time.perf_counter() - started
+
+    def _insert(self, batch):
+        with transaction.atomic():
+            Notification.objects.bulk_create(
+                [Notification(user_id=user_id, message_id=message_id)
+                 for user_id, message_id in batch],
+                batch_size=self.batch_size,
+            )
+            # bulk_create sends no post_save, so count them here
+            for user_id, n in Counter(user_id for user_id, _ in batch).items():
+                bump(user_id, notifications=n)
+                inbox_cache.invalidate(user_id)
+
+    def flush(self):
+        """Block until every queued notification has been written."""
+        if self._threads:
+            self._queue.join()
+            return
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def close(self):
+        """Flush and stop the workers."""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._queue.put(self._STOP)
+        for thread in threads:
+            thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "submitted": self.submitted,
+                "written": self.written,
+                "batches": self.batches,
+                "avg_batch": self.written / self.batches if self.batches else 0.0,
+                "pending": self._queue.qsize(),
+                "max_depth": self.max_depth,
+                "full_waits": self.full_waits,
+                "overflow_sync": self.overflow_sync,
+                "errors": self.errors,
+                "retried": self.retried,
+                "dropped": self.dropped,
+                "flush_ms": self.flush_seconds * 1e3,
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher():
+    """The process-wide dispatcher, built from settings on first use."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher.from_settings()
+        return _dispatcher
@@ -0,0 +1,271 @@
+# Chunked, resumable background purge of a user's messaging data
+
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import inbox_cache
+from .counters import reconcile_users
+from .models import Message, MessageHistory, Notification, PurgeJob
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "background",    # "background" (worker thread) or "sync"
+    "CHUNK_SIZE": 1000,      # primary keys per delete statement
+}
+
+
+def purge_settings():
+    """DEFAULTS overridden by settings.MESSAGING_PURGE."""
+    return {**DEFAULTS, **getattr(settings, "MESSAGING_PURGE", {})}
+
+
+def descendant_ids(message_ids, limit=None):
+    """
+    `message_ids` plus every reply below them, in one recursive query.
+
+    Ids come back deepest first, so with `limit` the result is the bottom
+    of the subtree: every returned message's replies are returned too, and
+    the batch can be deleted without leaving children behind.
+    """
+    if not message_ids:
+        return []
+    qn = connection.ops.quote_name
+    table = qn(Message._meta.db_table)
+    pk = qn(Message._meta.pk.column)
+    parent = qn(Message._meta.get_field("parent_message").column)
+    marks = ", ".join(["%s"] * len(message_ids))
+    sql = (
+        f"WITH RECURSIVE subtree(id, depth) AS ("
+        f" SELECT {pk}, 0 FROM {table} WHERE {pk} IN ({marks})"
+        f" UNION"
+        f" SELECT m.{pk}, subtree.depth + 1 FROM {table} m"
+        f" JOIN subtree ON m.{parent} = subtree.id"
+        f") SELECT id FROM subtree GROUP BY id ORDER BY MAX(depth) DESC, id"
+    )
+    params = list(message_ids)
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _delete_in(model, column, ids):
+    """DELETE ... WHERE column IN ids, without the collector or signals."""
+    if not ids:
+        return 0
+    qn = connection.ops.quote_name
+    marks = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {qn(model._meta.db_table)} WHERE {qn(column)} IN ({marks})",
+            list(ids))
+        return cursor.rowcount
+
+
+class PurgeEngine:
+    """
+    Deletes a user's messaging data in primary-key chunks, children before
+    parents, with raw bulk DELETEs (no model instances, no collector):
+
+      1. notifications addressed to the user
+      2. the user's sent and received messages with all replies below
+         them, deepest replies first and at most `chunk_size` messages per
+         step however large a thread is, each step preceded by their
+         history and notifications
+      3. edited_by on remaining history rows is cleared (SET_NULL)
+      4. the user row itself, now without dependents
+
+    Every chunk commits together with its PurgeJob row, so run() on an
+    interrupted job picks up where it stopped. `progress` is called with
+    job.progress() after each chunk.
+    """
+
+    def __init__(self, chunk_size=1000, progress=None):
+        # every chunk's ids are bound as query parameters
+        max_params = connection.features.max_query_params
+        self.chunk_size = min(chunk_size, max_params) if max_params else chunk_size
+        self.progress = progress
+
+    def run(self, job):
+        stages = {
+            "notifications": self._notifications,
+            "messages": self._messages,
+            "history": self._history,
+            "user": self._user,
+        }
+        while not job.done:
+            with transaction.atomic():
+                finished = stages[job.stage](job)
+                if finished:
+                    job.stage = PurgeJob.STAGES[PurgeJob.STAGES.index(job.stage) + 1]
+                    job.last_pk = 0
+                    if job.done:
+                        job.finished_at = timezone.now()
+                job.save()
+            if self.progress is not None:
+                self.progress(job.progress())
+        return job
+
+    def _chunk(self, queryset, job):
+        return list(
+            queryset.filter(pk__gt=job.last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: self.chunk_size]
+        )
+
+    def _notifications(self, job):
+        ids = self._chunk(Notification.objects.filter(user_id=job.user_id), job)
+        if not ids:
+            return True
+        job.notifications_deleted += _delete_in(Notification, Notification._meta.pk.column, ids)
+        job.last_pk = ids[-1]
+        return False
+
+    def _messages(self, job):
+        owned = Message.objects.filter(Q(sender_id=job.user_id) | Q(receiver_id=job.user_id))
+        ids = self._chunk(owned, job)
+        if not ids:
+            return True
+        # Deepest first and bounded, so a huge thread takes several steps;
+        # last_pk only moves on once this chunk's subtrees are all gone.
+        subtree = descendant_ids(ids, limit=self.chunk_size)
+        # raw deletes skip the signals: recount and re-version whoever loses
+        # rows from their inbox or counters
+        inboxes = set(Message.objects.filter(pk__in=subtree)
+                      .values_list("receiver_id", flat=True))
+        affected = set(Message.objects.filter(pk__in=subtree, read=False)
+                       .values_list("receiver_id", flat=True))
+        affected.update(Notification.objects.filter(message_id__in=subtree, read=False)
+                        .values_list("user_id", flat=True))
+        _delete_in(MessageHistory, "message_id", subtree)
+        _delete_in(Notification, "message_id", subtree)
+        job.messages_deleted += _delete_in(Message, Message._meta.pk.column, subtree)
+        reconcile_users(affected - {job.user_id})
+        for user_id in inboxes | affected:
+            inbox_cache.invalidate(user_id)
+        if len(subtree) < self.chunk_size:
+            job.last_pk = ids[-1]
+        return False
+
+    def _history(self, job):
+        ids = self._chunk(MessageHistory.objects.filter(edited_by_id=job.user_id), job)
+        if not ids:
+            return True
+        job.history_cleared += MessageHistory.objects.filter(pk__in=ids).update(
+            edited_by=None)
+        job.last_pk = ids[-1]
+        return False
+
+    def _user(self, job):
+        # The collector is cheap now; it still handles groups/permissions.
+        user = User.objects.filter(pk=job.user_id).first()
+        if user is not None:
+            user._purging = True
+            user.delete()
+        return True
+
+
+class PurgeWorker:
+    """Runs purge jobs one at a time on a background thread."""
+
+    def __init__(self, engine=None):
+        self.engine = engine or PurgeEngine(chunk_size=purge_settings()["CHUNK_SIZE"])
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, job_id):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="messaging-purge", daemon=True)
+                self._thread.start()
+        self._queue.put(job_id)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                run_job(job_id, self.engine)
+            except Exception:
+                # run_job() has marked the job failed; resume_pending_purges()
+                # retries it. The thread stays up for the next job.
+                logger.exception("purge job %s failed", job_id)
+            finally:
+                connection.close()
+                self._queue.task_done()
+
+    def join(self):
+        """Block until every submitted job has run."""
+        self._queue.join()
+
+
+def run_job(job_id, engine=None):
+    """
+    Run (or resume) one job. A failure marks the job failed (its `error`
+    is set) and is re-raised; a later successful run clears it.
+    """
+    engine = engine or PurgeEngine(chunk_size=purge_settings()["CHUNK_SIZE"])
+    job = PurgeJob.objects.get(pk=job_id)
+    job.error = ""
+    try:
+        return engine.run(job)
+    except Exception as e:
+        PurgeJob.objects.filter(pk=job_id).update(
+            error=f"{job.stage}: {type(e).__name__}: {e}")
+        raise
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = PurgeWorker()
+        return _worker
+
+
+def schedule_purge(user_id):
+    """
+    Create (or reuse) the user's PurgeJob and run it after the current
+    transaction commits: on the worker, or inline with MODE "sync".
+    """
+    job, _ = PurgeJob.objects.get_or_create(user_id=user_id)
+    if job.done:
+        return job
+    if purge_settings()["MODE"] == "sync":
+        return run_job(job.pk)
+    transaction.on_commit(lambda: get_worker().submit(job.pk))
+    return job
+
+
+def request_user_purge(user):
+    """
+    Take an account deletion off the request path: deactivate the user now
+    and let the purge delete their data, then the user row, in chunks.
+    """
+    if user.is_active:
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+    return schedule_purge(user.pk)
+
+
+def resume_pending_purges():
+    """Resubmit unfinished jobs, e.g. at worker start-up after a crash."""
+    pending = list(PurgeJob.objects.exclude(stage="done").values_list("pk", flat=True))
+    for job_id in pending:
+        get_worker().submit(job_id)
+    return len(pending)
@@ -1,9 +1,18 @@
 # ALX Task 2: Cleanup user-related data after account deletion
 
-from django.db.models.signals import post_delete, pre_save, post_save
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from .models import Message, Notification, MessageHistory
+from . import inbox_cache
+from .counters import bump
+from .history import record_history
+from .notifications import get_dispatcher, notification_settings
+from .purge import schedule_purge
 
 
 # -----------------------------------
@@ -12,50 +21,154 @@ from .models import Message, Notification, MessageHistory
 
 @receiver(post_save, sender=Message)
 def create_notification_on_message(sender, instance, created, **kwargs):
-    if created:
+    """
+    Notify the receiver. By default the row is queued once the message's
+    transaction commits and written in batches by the dispatcher
+    (notifications.py); MESSAGING_NOTIFICATIONS = {"MODE": "sync"} inserts
+    it right here instead, e.g. for tests.
+    """
+    if not created:
+        return
+    if notification_settings()["MODE"] == "sync":
         Notification.objects.create(user=instance.receiver, message=instance)
+    else:
+        transaction.on_commit(
+            partial(get_dispatcher().submit, instance.receiver_id, instance.pk)
+        )
 
 
 @receiver(pre_save, sender=Message)
-def log_message_edit(sender, instance, **kwargs):
+def log_message_edit(sender, instance, update_fields=None, **kwargs):
+    """
+    Record the old content when a message's content changes.
+
+    The old value comes from the snapshot Message keeps of its loaded
+    fields, so saves that don't change `content` run no extra query. Only
+    instances that weren't loaded from the database (e.g. built by hand
+    with a pk) fall back to fetching the stored content.
+    """
     if not instance.pk:
         return
-
-    try:
-        old = Message.objects.get(pk=instance.pk)
-    except Message.DoesNotExist:
+    if update_fields is not None and "content" not in update_fields:
         return
+    if "content" in instance.get_deferred_fields():
+        return  # not loaded, so not being saved either
 
-    if old.content != instance.content:
-        MessageHistory.objects.create(
-            message=old,
-            old_content=old.content,
-            edited_by=old.sender
+    if instance.has_loaded_value("content"):
+        old_content = instance.loaded_value("content")
+    else:
+        old_content = (
+            Message.objects.filter(pk=instance.pk)
+            .values_list("content", flat=True)
+            .first()
         )
+        if old_content is None:
+            return
+
+    if old_content != instance.content:
+        record_history(MessageHistory(
+            message_id=instance.pk,
+            old_content=old_content,
+            edited_by_id=instance.sender_id,
+        ))
         instance.edited = True
 
 
 # -----------------------------------
-# TASK 2 — post_delete on USER
+# Unread counters (counters.py)
 # -----------------------------------
-@receiver(post_delete, sender=User)
-def cleanup_user_data(sender, instance, **kwargs):
+def _unread_delta(instance, created):
+    """+1 / -1 / 0 change in unread count caused by this save."""
+    if created:
+        return 0 if instance.read else 1
+    if not instance.has_loaded_value("read"):
+        return 0  # unknown previous state; reconcile() repairs any drift
+    return int(not instance.read) - int(not instance.loaded_value("read"))
+
+
+@receiver(post_save, sender=Message)
+def count_unread_messages(sender, instance, created, **kwargs):
+    bump(instance.receiver_id, messages=_unread_delta(instance, created))
+
+
+@receiver(post_save, sender=Notification)
+def count_unread_notifications(sender, instance, created, **kwargs):
+    bump(instance.user_id, notifications=_unread_delta(instance, created))
+
+
+@receiver(post_delete, sender=Message)
+def uncount_deleted_message(sender, instance, **kwargs):
+    if not instance.read:
+        bump(instance.receiver_id, messages=-1)
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    if not instance.read:
+        bump(instance.user_id, notifications=-1)
+
+
+# -----------------------------------
+# Inbox cache versions (inbox_cache.py)
+# -----------------------------------
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def invalidate_receiver_inbox(sender, instance, **kwargs):
+    inbox_cache.invalidate(instance.receiver_id)
+
+
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_notified_inbox(sender, instance, **kwargs):
+    inbox_cache.invalidate(instance.user_id)
+
+
+@receiver(post_init, sender=User)
+def snapshot_username(sender, instance, **kwargs):
+    # __dict__, not the attribute: a deferred username must not be loaded here
+    instance._loaded_username = instance.__dict__.get("username")
+
+
+@receiver(post_save, sender=User)
+def invalidate_inboxes_on_rename(sender, instance, created, update_fields=None, **kwargs):
     """
-    When a user is deleted:
-    - Delete all messages they sent
-    - Delete all messages they received
-    - Delete all notifications addressed to them
-    - Delete history entries connected to their messages
+    Cached inbox rows embed the sender's username: re-version the inboxes
+    of everyone this user has written to when it changes. The old name is
+    the one snapshotted at load, so saves without a rename run no query.
     """
+    if update_fields is not None and "username" not in update_fields:
+        return  # e.g. login's save(update_fields=["last_login"])
+    old = getattr(instance, "_loaded_username", None)
+    instance._loaded_username = instance.__dict__.get("username")
+    if created or old is None or old == instance._loaded_username:
+        return
+    inbox_cache.invalidate_many(
+        Message.objects.filter(sender_id=instance.pk)
+        .values_list("receiver_id", flat=True).distinct()
+    )
 
-    # Delete messages where user was sender or receiver
-    user_messages = Message.objects.filter(sender=instance) | Message.objects.filter(receiver=instance)
-
-    # Delete all message histories linked to those messages
-    MessageHistory.objects.filter(message__in=user_messages).delete()
 
-    # Delete notifications for this user
-    Notification.objects.filter(user=instance).delete()
+# -----------------------------------
+# TASK 2 — post_delete on USER
+# -----------------------------------
+@receiver(post_delete, sender=User)
+def cleanup_user_data(sender, instance, **kwargs):
+    """
+    Make sure no messaging data outlives a deleted user:
+    - messages they sent or received, with their replies
+    - notifications addressed to them
+    - history entries connected to their messages
 
-    # Finally delete the messages themselves
-    user_messages.delete()
+    Account deletion should go through purge.request_user_purge(user): it
+    deactivates the user at once and deletes the data, then the user row,
+    in primary-key chunks on the purge worker. A direct user.delete()
+    instead cascades through Django's collector inside the request, so by
+    the time this runs the data is already gone; a purge is only scheduled
+    if something was left behind (rows the collector can't see).
+    """
+    if getattr(instance, "_purging", False):
+        return  # the purge itself is deleting the user row
+    user_id = instance.pk
+    if (Message.objects.filter(Q(sender_id=user_id) | Q(receiver_id=user_id)).exists()
+            or Notification.objects.filter(user_id=user_id).exists()):
+        schedule_purge(user_id)
@@ -1,7 +1,23 @@
-from django.test import TestCase
+import base64
+import re
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
 from django.contrib.auth.models import User
-from .models import Message, Notification, MessageHistory
+from django.test.utils import CaptureQueriesContext
+from .models import Message, Notification, MessageHistory, PurgeJob, UnreadCounter
+from .counters import bump, get_counts, reconcile
+from .history import history_batch
+from .notifications import NotificationDispatcher
+from .purge import PurgeEngine, request_user_purge
+from .threads import InvalidCursor, ThreadLoader, encode_cursor
+from . import inbox_cache
+from .views import cached_conversation
 
+@override_settings(MESSAGING_NOTIFICATIONS={"MODE": "sync"})
 class MessagingSignalsTests(TestCase):
     def setUp(self):
         self.alice = User.objects.create_user(username="alice", password="pass")
@@ -20,3 +36,612 @@ class MessagingSignalsTests(TestCase):
         histories = MessageHistory.objects.filter(message=msg)
         self.assertEqual(histories.count(), 1, "MessageHistory should record old content on edit")
         self.assertTrue(msg.edited, "Message.edited should be set to True after edit")
+
+    def test_save_without_content_change_runs_only_the_update(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, content="Hello")
+        msg = Message.objects.get(content="Hello")
+        msg.read = True
+        with CaptureQueriesContext(connection) as queries:
+            msg.save()
+        # the message UPDATE plus the unread-counter UPDATE, no SELECT
+        self.assertEqual(
+            [q["sql"].split()[0] for q in queries.captured_queries], ["UPDATE", "UPDATE"]
+        )
+        self.assertFalse(MessageHistory.objects.exists())
+
+    def test_refresh_then_save_records_no_history(self):
+        msg = Message.objects.create(sender=self.alice, receiver=self.bob, content="A")
+        Message.objects.filter(pk=msg.pk).update(content="B")
+        msg.refresh_from_db()
+        msg.save()
+        self.assertFalse(MessageHistory.objects.exists())
+        self.assertFalse(msg.edited)
+
+        Message.objects.filter(pk=msg.pk).update(content="C")
+        msg.refresh_from_db(fields=["content"])
+        msg.content = "D"
+        msg.save()
+        self.assertEqual(list(MessageHistory.objects.values_list("old_content", flat=True)), ["C"])
+
+    def test_edit_of_loaded_message_does_not_refetch(self):
+        Message.objects.create(sender=self.alice, receiver=self.bob, content="Before")
+        msg = Message.objects.get(content="Before")
+        msg.content = "After"
+        with self.assertNumQueries(2):  # history insert + update
+            msg.save()
+        msg.content = "Again"
+        msg.save()
+        self.assertEqual(
+            list(MessageHistory.objects.order_by("pk").values_list("old_content", flat=True)),
+            ["Before", "After"],
+        )
+
+    def test_history_batch_inserts_history_in_bulk(self):
+        for i in range(5):
+            Message.objects.create(sender=self.alice, receiver=self.bob, content=f"m{i}")
+        messages = list(Message.objects.all())
+        # 5 updates + 1 bulk insert, inside one savepoint
+        with self.assertNumQueries(8):
+            with transaction.atomic(), history_batch():
+                for msg in messages:
+                    msg.content += " (edited)"
+                    msg.save()
+        self.assertEqual(MessageHistory.objects.count(), 5)
+
+
+class ThreadedRepliesTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+        self.root = Message.objects.create(sender=self.alice, receiver=self.bob, content="root")
+
+    def reply(self, parent, content):
+        return Message.objects.create(
+            sender=self.bob, receiver=self.alice, content=content, parent_message=parent
+        )
+
+    def grow(self, parent, depth, width):
+        """Add `width` replies per level, `depth` levels below `parent`."""
+        if depth == 0:
+            return
+        for i in range(width):
+            child = self.reply(parent, f"{parent.content}.{i}")
+            self.grow(child, depth - 1, width)
+
+    def test_replies_are_depth_first_with_depth(self):
+        a = self.reply(self.root, "a")
+        a1 = self.reply(a, "a1")
+        b = self.reply(self.root, "b")
+        a1x = self.reply(a1, "a1x")
+        a2 = self.reply(a, "a2")
+
+        replies = self.root.get_all_replies()
+
+        self.assertEqual(replies, [a, a1, a1x, a2, b])
+        self.assertEqual([r.depth for r in replies], [1, 2, 3, 2, 1])
+
+    def test_query_count_is_constant_as_the_tree_grows(self):
+        self.grow(self.root, depth=2, width=2)
+        with self.assertNumQueries(1):
+            small = self.root.get_all_replies()
+
+        self.grow(self.root, depth=5, width=3)
+        with self.assertNumQueries(1):
+            large = self.root.get_all_replies()
+
+        self.assertEqual(len(small), 6)
+        self.assertEqual(len(large), 6 + 363)
+
+    def test_walking_the_loaded_tree_runs_no_queries(self):
+        self.grow(self.root, depth=3, width=2)
+        self.root.get_all_replies()
+
+        def walk(node):
+            return sum(1 + walk(child) for child in node.replies.all())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(walk(self.root), 14)
+
+
+class ThreadLoaderTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+        self.root = Message.objects.create(sender=self.alice, receiver=self.bob, content="root")
+
+    def reply(self, parent, content):
+        return Message.objects.create(
+            sender=self.bob, receiver=self.alice, content=content, parent_message=parent
+        )
+
+    def test_loads_any_depth_with_one_query_per_level(self):
+        parent = self.root
+        for i in range(8):
+            parent = self.reply(parent, f"level {i + 1}")
+
+        loader = ThreadLoader(self.root)
+        # one query per level (8), one that finds no 9th level, one for users
+        with self.assertNumQueries(10):
+            page = loader.page()
+            node, depth = page.replies[0], 1
+            while node.replies:
+                self.assertEqual(node.message.sender.username, "bob")
+                node, depth = node.replies[0], depth + 1
+        self.assertEqual((depth, node.message.content), (8, "level 8"))
+
+    def test_top_level_replies_are_paginated_by_cursor(self):
+        replies = [self.reply(self.root, str(i)) for i in range(5)]
+        loader = ThreadLoader(self.root, page_size=2)
+
+        seen, cursor = [], None
+        while True:
+            page = loader.page(after=cursor)
+            seen += [node.message for node in page.replies]
+            cursor = page.next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, replies)
+
+    def test_wide_branches_are_cut_and_resumable(self):
+        top = self.reply(self.root, "top")
+        children = [self.reply(top, str(i)) for i in range(5)]
+        loader = ThreadLoader(self.root, branch_size=2)
+
+        node = loader.page().replies[0]
+        self.assertEqual([n.message for n in node.replies], children[:2])
+        self.assertTrue(node.has_more)
+
+        rest = loader.branch(node, after=node.next_cursor)
+        self.assertEqual([n.message for n in rest.replies], children[2:])
+        self.assertEqual(rest.replies[0].depth, 2)
+        self.assertEqual(loader.branch(top.pk).replies[0].depth, 2)
+
+    def test_max_depth_marks_unloaded_children(self):
+        top = self.reply(self.root, "top")
+        self.reply(self.reply(top, "child"), "grandchild")
+
+        node = ThreadLoader(self.root, max_depth=1).page().replies[0]
+        child = node.replies[0]
+        self.assertEqual(child.replies, [])
+        self.assertEqual(child.next_cursor, "")
+        self.assertEqual(child.as_dict()["content"], "child")
+
+    def test_max_nodes_caps_the_page(self):
+        top = self.reply(self.root, "top")
+        children = [self.reply(top, str(i)) for i in range(4)]
+        for child in children:
+            self.reply(child, "grandchild")
+
+        page = ThreadLoader(self.root, max_nodes=3).page()
+        node = page.replies[0]
+        self.assertEqual([n.message for n in node.replies], children[:2])
+        self.assertEqual(node.next_cursor, encode_cursor(children[1]))
+        self.assertTrue(all(n.replies == [] and n.next_cursor == "" for n in node.replies))
+
+        rest = ThreadLoader(self.root).branch(node, after=node.next_cursor)
+        self.assertEqual([n.message for n in rest.replies], children[2:])
+
+    def test_invalid_cursor(self):
+        loader = ThreadLoader(self.root)
+        for cursor in ("not-base64!", "Zm9v", base64.urlsafe_b64encode(b"x|y").decode()):
+            with self.assertRaises(InvalidCursor):
+                loader.page(after=cursor)
+
+
+class NotificationDispatcherTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+
+    def test_notifications_are_written_after_commit(self):
+        from .notifications import get_dispatcher
+
+        msg = Message.objects.create(sender=self.alice, receiver=self.bob, content="Hi")
+        get_dispatcher().flush()
+        self.assertEqual(Notification.objects.filter(user=self.bob, message=msg).count(), 1)
+
+
+class NotificationBackpressureTests(TestCase):
+    def test_batches_and_backpressure(self):
+        alice = User.objects.create_user(username="alice", password="pass")
+        bob = User.objects.create_user(username="bob", password="pass")
+        messages = Message.objects.bulk_create(
+            [Message(sender=alice, receiver=bob, content=str(i)) for i in range(50)]
+        )  # no post_save: submit by hand
+        # no workers: the queue fills up and overflows until flush() drains it
+        dispatcher = NotificationDispatcher(batch_size=20, workers=0, max_pending=10,
+                                            put_timeout=0)
+        for msg in messages:
+            dispatcher.submit(bob.pk, msg.pk)
+        dispatcher.flush()
+
+        stats = dispatcher.stats()
+        self.assertEqual(Notification.objects.count(), 50)
+        self.assertEqual((stats["written"], stats["errors"]), (50, 0))
+        self.assertEqual((stats["max_depth"], stats["full_waits"]), (10, 40))
+        self.assertEqual(stats["overflow_sync"], 40)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_failed_batches_are_retried_then_split(self):
+        alice = User.objects.create_user(username="alice", password="pass")
+        bob = User.objects.create_user(username="bob", password="pass")
+        messages = Message.objects.bulk_create(
+            [Message(sender=alice, receiver=bob, content=str(i)) for i in range(4)]
+        )
+        dispatcher = NotificationDispatcher(batch_size=10, workers=0, retries=2,
+                                            retry_backoff=0)
+        insert = dispatcher._insert
+        poisoned = (bob.pk, messages[0].pk)
+
+        def failing_insert(batch):
+            if poisoned in batch:
+                raise RuntimeError("write failed")
+            insert(batch)
+
+        for msg in messages:
+            dispatcher.submit(bob.pk, msg.pk)
+        with mock.patch.object(dispatcher, "_insert", side_effect=failing_insert), \
+                self.assertLogs("messaging.notifications", "ERROR"):
+            dispatcher.flush()
+
+        stats = dispatcher.stats()
+        self.assertEqual(Notification.objects.count(), 3)
+        self.assertEqual((stats["written"], stats["retried"], stats["dropped"]), (3, 2, 1))
+
+
+@override_settings(
+    MESSAGING_NOTIFICATIONS={"MODE": "sync"},
+    MESSAGING_PURGE={"MODE": "sync", "CHUNK_SIZE": 3},
+)
+class UserPurgeTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+        self.carol = User.objects.create_user(username="carol", password="pass")
+        for i in range(4):
+            sent = Message.objects.create(sender=self.alice, receiver=self.bob, content=f"a{i}")
+            Message.objects.create(
+                sender=self.bob, receiver=self.carol, content=f"reply {i}", parent_message=sent
+            )
+            sent.content += " (edited)"
+            sent.save()
+        self.unrelated = Message.objects.create(sender=self.bob, receiver=self.carol, content="hi")
+        edited = Message.objects.create(sender=self.alice, receiver=self.carol, content="x")
+        edited.content = "y"
+        edited.save()
+        MessageHistory.objects.create(message=self.unrelated, old_content="old", edited_by=self.alice)
+
+    def test_purge_removes_data_in_chunks_then_the_user(self):
+        job = request_user_purge(self.alice)
+
+        self.assertTrue(PurgeJob.objects.get(pk=job.pk).done)
+        self.assertFalse(User.objects.filter(pk=self.alice.pk).exists())
+        self.assertEqual(list(Message.objects.all()), [self.unrelated])
+        self.assertEqual(Notification.objects.count(), 1)
+        self.assertEqual(job.messages_deleted, 9)
+        self.assertEqual(job.notifications_deleted, 0)
+        history = MessageHistory.objects.get()
+        self.assertIsNone(history.edited_by_id)
+
+    def test_interrupted_purge_resumes_from_its_job_row(self):
+        job = PurgeJob.objects.create(user_id=self.alice.pk)
+
+        class Crash(Exception):
+            pass
+
+        def crash_after_first_chunk(progress):
+            if progress["messages_deleted"]:
+                raise Crash
+
+        with self.assertRaises(Crash):
+            PurgeEngine(chunk_size=3, progress=crash_after_first_chunk).run(job)
+        job.refresh_from_db()
+        # the first step is bounded by chunk_size: the three deepest replies
+        self.assertEqual((job.stage, job.messages_deleted), ("messages", 3))
+
+        PurgeEngine(chunk_size=3).run(job)
+        self.assertEqual(job.stage, "done")
+        self.assertEqual(job.messages_deleted, 9)
+        self.assertFalse(Message.objects.filter(sender=self.alice.pk).exists())
+
+    def test_deep_thread_is_deleted_in_bounded_steps(self):
+        parent = Message.objects.filter(sender=self.alice).order_by("pk").first()
+        for i in range(10):
+            parent = Message.objects.create(
+                sender=self.carol, receiver=self.bob, content=f"deep {i}", parent_message=parent
+            )
+        steps = []
+        job = PurgeJob.objects.create(user_id=self.alice.pk)
+        with CaptureQueriesContext(connection) as queries:
+            PurgeEngine(chunk_size=4, progress=steps.append).run(job)
+
+        self.assertEqual(job.messages_deleted, 19)
+        self.assertEqual(list(Message.objects.all()), [self.unrelated])
+        deleted = [b["messages_deleted"] - a["messages_deleted"]
+                   for a, b in zip([{"messages_deleted": 0}] + steps, steps)]
+        self.assertLessEqual(max(deleted), 4)
+        # no statement binds more ids than one chunk
+        in_lists = [m.count(",") + 1 for q in queries
+                    for m in re.findall(r" IN \(([^()]*)\)", q["sql"])]
+        self.assertTrue(in_lists)
+        self.assertLessEqual(max(in_lists), 4)
+
+    def test_failed_job_is_marked_and_resumable(self):
+        from .purge import run_job
+
+        job = PurgeJob.objects.create(user_id=self.alice.pk)
+        engine = PurgeEngine(chunk_size=3)
+        with mock.patch.object(engine, "_messages", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                run_job(job.pk, engine)
+        job.refresh_from_db()
+        self.assertTrue(job.failed)
+        self.assertEqual(job.error, "messages: RuntimeError: disk full")
+
+        run_job(job.pk, engine)
+        job.refresh_from_db()
+        self.assertTrue(job.done)
+        self.assertFalse(job.failed)
+
+    def test_worker_survives_a_failed_job(self):
+        from .purge import PurgeWorker
+
+        worker = PurgeWorker(PurgeEngine())
+        with mock.patch("messaging.purge.run_job", side_effect=[RuntimeError("boom"), None]) as run, \
+                mock.patch("messaging.purge.connection.close"), \
+                self.assertLogs("messaging.purge", "ERROR") as logs:
+            worker.submit(1)
+            worker.submit(2)
+            worker.join()
+        self.assertEqual([c.args[0] for c in run.call_args_list], [1, 2])
+        self.assertIn("purge job 1 failed", logs.output[0])
+
+    def test_direct_user_delete_cascades_without_a_purge_job(self):
+        alice_id = self.alice.pk
+        self.alice.delete()
+        self.assertEqual(list(Message.objects.all()), [self.unrelated])
+        self.assertFalse(PurgeJob.objects.filter(user_id=alice_id).exists())
+
+
+@override_settings(MESSAGING_NOTIFICATIONS={"MODE": "sync"})
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+
+    def send(self, n):
+        return [
+            Message.objects.create(sender=self.alice, receiver=self.bob, content=str(i))
+            for i in range(n)
+        ]
+
+    def counts(self):
+        return (Message.unread.unread_count(self.bob),
+                Notification.objects.unread_count(self.bob))
+
+    def test_counts_follow_create_read_and_delete(self):
+        messages = self.send(3)
+        self.assertEqual(self.counts(), (3, 3))
+
+        msg = Message.objects.get(pk=messages[0].pk)
+        msg.read = True
+        msg.save()
+        self.assertEqual(self.counts(), (2, 3))
+
+        messages[1].delete()  # also deletes its notification
+        self.assertEqual(self.counts(), (1, 2))
+
+        Notification.objects.mark_read(self.bob)
+        Message.unread.mark_read(self.bob)
+        self.assertEqual(self.counts(), (0, 0))
+
+    def test_mark_read_then_refresh_and_save_counts_once(self):
+        msg, _ = self.send(2)
+        self.assertEqual(self.counts(), (2, 2))
+        Message.unread.mark_read(self.bob, message_ids=[msg.pk])
+        msg.refresh_from_db()
+        msg.save()
+        self.assertEqual(get_counts(self.bob.pk)["messages"], 1)
+
+    def test_counters_never_go_negative(self):
+        self.send(1)
+        self.counts()
+        bump(self.bob.pk, messages=-5)
+        self.assertEqual(UnreadCounter.objects.get(user=self.bob).messages, 0)
+
+    def test_cached_count_runs_no_query(self):
+        self.send(2)
+        self.counts()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), (2, 2))
+
+    def test_reconcile_repairs_drift(self):
+        self.send(4)
+        Message.objects.filter(receiver=self.bob).update(read=True)  # bypasses signals
+        UnreadCounter.objects.filter(user=self.alice).delete()
+
+        self.assertEqual(reconcile(chunk_size=1), {"checked": 2, "repaired": 2})
+        self.assertEqual(self.counts(), (0, 4))
+        self.assertEqual(reconcile()["repaired"], 0)
+
+
+@skipUnless(connection.vendor == "sqlite", "plan assertions use SQLite EXPLAIN output")
+class IndexPlanTests(TestCase):
+    """
+    Seeds a few thousand rows, then checks that each hot access path is
+    served by its index (no full scan, no temp sort) and that the inbox
+    view's query count doesn't grow with the data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(username=f"user{i}", password="pass") for i in range(20)
+        ]
+        messages = Message.objects.bulk_create(
+            Message(
+                sender=cls.users[i % 20],
+                receiver=cls.users[(i * 7 + 1) % 20],
+                content=f"message {i}",
+                read=i % 3 == 0,
+            )
+            for i in range(4000)
+        )
+        Message.objects.bulk_create(
+            Message(sender=cls.users[0], receiver=cls.users[1], content=f"reply {i}",
+                    parent_message=messages[i % 50])
+            for i in range(500)
+        )
+        Notification.objects.bulk_create(
+            Notification(user_id=m.receiver_id, message=m, read=m.read) for m in messages
+        )
+        MessageHistory.objects.bulk_create(
+            MessageHistory(message=messages[i % 400], old_content="old") for i in range(2000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.user = cls.users[1]
+        cls.root = messages[0]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index}", plan)
+        self.assertNotIn("USE TEMP B-TREE", plan)
+        for line in plan.splitlines():
+            self.assertFalse(line.split("SCAN ")[-1].startswith("messaging_"),
+                             f"full scan in plan:\n{plan}")
+
+    def test_unread_inbox_uses_partial_unread_index(self):
+        self.assertUsesIndex(
+            Message.unread.unread_for_user(self.user).order_by("-timestamp"),
+            "msg_unread_recv_ts_idx",
+        )
+
+    def test_inbox_uses_receiver_timestamp_index(self):
+        self.assertUsesIndex(
+            Message.objects.filter(receiver=self.user).order_by("-timestamp"),
+            "msg_recv_ts_idx",
+        )
+
+    def test_reply_lookup_uses_parent_index(self):
+        self.assertUsesIndex(
+            Message.objects.filter(parent_message=self.root).order_by("timestamp"),
+            "msg_parent_ts_idx",
+        )
+
+    def test_unread_notifications_use_partial_unread_index(self):
+        self.assertUsesIndex(
+            Notification.objects.filter(user=self.user, read=False).order_by("-created_at"),
+            "notif_unread_user_idx",
+        )
+
+    def test_history_uses_message_edited_at_index(self):
+        self.assertUsesIndex(
+            MessageHistory.objects.filter(message=self.root).order_by("edited_at"),
+            "hist_msg_edited_idx",
+        )
+
+    def test_inbox_view_query_count(self):
+        request = RequestFactory().get("/inbox/")
+        request.user = self.user
+
+        def render(request, template, context):
+            list(context["messages"])
+            return HttpResponse("ok")
+
+        cache.clear()
+        with mock.patch("messaging.views.render", side_effect=render):
+            with self.assertNumQueries(1):
+                cached_conversation(request)
+            with self.assertNumQueries(0):
+                cached_conversation(request)
+
+
+@override_settings(MESSAGING_NOTIFICATIONS={"MODE": "sync"})
+class InboxCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        inbox_cache.stats.reset()
+        self.alice = User.objects.create_user(username="alice", password="pass")
+        self.bob = User.objects.create_user(username="bob", password="pass")
+        self.factory = RequestFactory()
+        self.rendered = []
+        patcher = mock.patch("messaging.views.render", side_effect=self.render)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def render(self, request, template, context):
+        self.rendered.append([row["content"] for row in context["messages"]])
+        self.senders = [row["sender"] for row in context["messages"]]
+        return HttpResponse("ok")
+
+    def view(self, user):
+        request = self.factory.get("/inbox/")
+        request.user = user
+        return cached_conversation(request)
+
+    def send(self, content):
+        return Message.objects.create(sender=self.alice, receiver=self.bob, content=content)
+
+    def test_entry_is_reused_until_the_inbox_changes(self):
+        self.send("first")
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "miss")
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "hit")
+
+        self.send("second")
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "miss")
+        self.assertEqual(self.rendered[-1], ["second", "first"])
+
+    def test_edits_reads_and_other_users_inboxes(self):
+        msg = self.send("hello")
+        self.view(self.bob)
+        self.view(self.alice)
+
+        msg.content = "hello (edited)"
+        msg.save()
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "miss")
+        self.assertEqual(self.rendered[-1], ["hello (edited)"])
+        # alice's inbox didn't change
+        self.assertEqual(self.view(self.alice)["X-Inbox-Cache"], "hit")
+
+        Notification.objects.mark_read(self.bob)
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "miss")
+
+    def test_sender_rename_invalidates_receivers(self):
+        self.send("hi")
+        self.view(self.bob)
+        self.view(self.alice)
+
+        self.alice.last_login = self.alice.date_joined
+        with self.assertNumQueries(1):
+            self.alice.save(update_fields=["last_login"])
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "hit")
+
+        # a full save without a rename: just the UPDATE, no SELECT
+        alice = User.objects.get(pk=self.alice.pk)
+        alice.first_name = "Alice"
+        with self.assertNumQueries(1):
+            alice.save()
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "hit")
+
+        alice.username = "alice2"
+        with mock.patch.object(transaction, "on_commit") as on_commit:
+            alice.save()
+        on_commit.assert_called_once()
+        on_commit.call_args.args[0]()
+        self.assertEqual(self.view(self.bob)["X-Inbox-Cache"], "miss")
+        self.assertEqual(self.senders, ["alice2"])
+        # alice's own inbox doesn't show her name
+        self.assertEqual(self.view(self.alice)["X-Inbox-Cache"], "hit")
+
+    def test_stats_report_hit_rate_and_rebuild_time(self):
+        self.send("hi")
+        for _ in range(4):
+            response = self.view(self.bob)
+        self.assertIn("inbox-rebuild;dur=", response["Server-Timing"])
+
+        stats = inbox_cache.stats.as_dict()
+        self.assertEqual((stats["hits"], stats["misses"]), (3, 1))
+        self.assertEqual(stats["hit_rate"], 0.75)
+        self.assertGreater(stats["rebuild_max_ms"], 0)
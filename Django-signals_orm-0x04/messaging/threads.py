@@ -0,0 +1,231 @@
+# Threaded conversation loader: any depth, paginated, bounded memory
+
+import base64
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Message
+
+
+def encode_cursor(message):
+    """Opaque keyset cursor for the position just after `message`."""
+    raw = f"{message.timestamp.isoformat()}|{message.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that encode_cursor() did not produce."""
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, AttributeError) as e:
+        # binascii.Error and UnicodeDecodeError are ValueErrors too
+        raise InvalidCursor(f"invalid thread cursor: {cursor!r}") from e
+
+
+def _after(cursor):
+    """Filter for siblings ordered after `cursor` by (timestamp, pk)."""
+    timestamp, pk = decode_cursor(cursor)
+    return Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, pk__gt=pk)
+
+
+class ThreadNode:
+    """
+    One message in a loaded thread.
+
+    `replies` holds the loaded children in timestamp order. `next_cursor`
+    is None when every child is loaded; otherwise pass it to
+    ThreadLoader.branch(node, node.next_cursor) for the rest
+    ("" means the children were cut off by max_depth or max_nodes and
+    none are loaded).
+    """
+
+    __slots__ = ("message", "depth", "replies", "next_cursor")
+
+    def __init__(self, message, depth):
+        self.message = message
+        self.depth = depth
+        self.replies = []
+        self.next_cursor = None
+
+    @property
+    def has_more(self):
+        return self.next_cursor is not None
+
+    def as_dict(self):
+        message = self.message
+        return {
+            "id": message.pk,
+            "sender": message.sender.username,
+            "receiver": message.receiver.username,
+            "content": message.content,
+            "timestamp": message.timestamp.isoformat(),
+            "depth": self.depth,
+            "replies": [reply.as_dict() for reply in self.replies],
+            "next_cursor": self.next_cursor,
+        }
+
+
+class ThreadPage:
+    """A page of replies under one message plus the cursor for the next page."""
+
+    __slots__ = ("parent_id", "replies", "next_cursor")
+
+    def __init__(self, parent_id, replies, next_cursor):
+        self.parent_id = parent_id
+        self.replies = replies
+        self.next_cursor = next_cursor
+
+    def as_dict(self):
+        return {
+            "parent": self.parent_id,
+            "replies": [reply.as_dict() for reply in self.replies],
+            "next_cursor": self.next_cursor,
+        }
+
+
+class ThreadLoader:
+    """
+    Loads a conversation thread as nested ThreadNodes, a page at a time.
+
+    - page_size: direct replies per page (top level, or of one branch)
+    - branch_size: children loaded per message below that; wider
+      sub-branches get a next_cursor instead of being loaded in full
+    - max_depth: levels below the page to load (None = all of them)
+    - max_nodes: messages per page in total; once reached, the remaining
+      children get a next_cursor instead of being loaded
+
+    Each page costs one query per tree level plus one for the users, no
+    matter how many messages it contains, and holds at most
+    min(max_nodes, page_size * branch_size ** max_depth) messages.
+    Cursors that don't decode raise InvalidCursor (a ValueError).
+
+    Usage:
+        loader = ThreadLoader(root_id, page_size=20, branch_size=10)
+        page = loader.page()
+        more = loader.page(after=page.next_cursor)
+        rest = loader.branch(node, after=node.next_cursor)
+    """
+
+    def __init__(self, root, page_size=50, branch_size=20, max_depth=10,
+                 max_nodes=1000):
+        if isinstance(root, Message):
+            self.root = root
+        else:
+            self.root = Message.objects.select_related("sender", "receiver").get(pk=root)
+        self.page_size = page_size
+        self.branch_size = branch_size
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+
+    def page(self, after=None):
+        """Top-level replies to the root message, after `after`."""
+        return self._page(self.root.pk, 1, after)
+
+    def branch(self, parent, after=None):
+        """
+        The next replies to a message inside the thread; `parent` is a
+        ThreadNode from an earlier page or a message id.
+        """
+        if isinstance(parent, ThreadNode):
+            return self._page(parent.message.pk, parent.depth + 1, after)
+        return self._page(parent, _depth_below(self.root.pk, parent) + 1, after)
+
+    def _page(self, parent_id, depth, after):
+        replies = Message.objects.filter(parent_message_id=parent_id)
+        if after:
+            replies = replies.filter(_after(after))
+        replies = list(replies.order_by("timestamp", "pk")[: self.page_size + 1])
+        next_cursor = None
+        if len(replies) > self.page_size:
+            replies = replies[: self.page_size]
+            next_cursor = encode_cursor(replies[-1])
+        nodes = [ThreadNode(message, depth) for message in replies]
+        self._expand(nodes, depth)
+        return ThreadPage(parent_id, nodes, next_cursor)
+
+    def _expand(self, level, depth):
+        """Load the levels below `level` breadth-first, one query per level."""
+        loaded = list(level)
+        budget = self.max_nodes - len(loaded)
+        levels_loaded = 0
+        while level:
+            by_id = {node.message.pk: node for node in level}
+            if budget <= 0 or (self.max_depth is not None
+                               and levels_loaded >= self.max_depth):
+                for parent_id in (Message.objects.filter(parent_message_id__in=by_id)
+                                  .values_list("parent_message_id", flat=True)
+                                  .distinct()):
+                    by_id[parent_id].next_cursor = ""
+                break
+            children = (
+                Message.objects.filter(parent_message_id__in=by_id)
+                .annotate(sibling_rank=Window(
+                    RowNumber(),
+                    partition_by=F("parent_message_id"),
+                    order_by=(F("timestamp").asc(), F("pk").asc()),
+                ))
+                .filter(sibling_rank__lte=self.branch_size + 1)
+                .order_by("parent_message_id", "timestamp", "pk")
+            )
+            next_level = []
+            for message in children:
+                parent = by_id[message.parent_message_id]
+                if parent.next_cursor is not None:
+                    continue
+                if message.sibling_rank > self.branch_size or budget <= 0:
+                    parent.next_cursor = (encode_cursor(parent.replies[-1].message)
+                                          if parent.replies else "")
+                    continue
+                node = ThreadNode(message, depth + 1)
+                parent.replies.append(node)
+                next_level.append(node)
+                budget -= 1
+            loaded += next_level
+            level = next_level
+            depth += 1
+            levels_loaded += 1
+        _attach_users(loaded)
+
+
+def _depth_below(root_id, message_id):
+    """Depth of a message below the root (0 = the root), in one query."""
+    qn = connection.ops.quote_name
+    table = qn(Message._meta.db_table)
+    pk = qn(Message._meta.pk.column)
+    parent = qn(Message._meta.get_field("parent_message").column)
+    sql = (
+        f"WITH RECURSIVE up AS ("
+        f" SELECT {pk} AS id, {parent} AS parent, 0 AS depth FROM {table} WHERE {pk} = %s"
+        f" UNION ALL"
+        f" SELECT m.{pk}, m.{parent}, up.depth + 1 FROM {table} m"
+        f" JOIN up ON m.{pk} = up.parent WHERE up.id != %s"
+        f") SELECT depth FROM up WHERE id = %s"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [message_id, root_id, root_id])
+        row = cursor.fetchone()
+    if row is None:
+        raise Message.DoesNotExist(f"message {message_id} is not in thread {root_id}")
+    return row[0]
+
+
+def _attach_users(nodes):
+    """Fetch senders and receivers for all nodes in one query."""
+    messages = [node.message for node in nodes]
+    ids = {m.sender_id for m in messages} | {m.receiver_id for m in messages}
+    if not ids:
+        return
+    users = User.objects.only("id", "username").in_bulk(ids)
+    sender = Message.sender.field
+    receiver = Message.receiver.field
+    for message in messages:
+        sender.set_cached_value(message, users[message.sender_id])
+        receiver.set_cached_value(message, users[message.receiver_id])
@@ -1,24 +1,55 @@
-# ALX Task 5: Caching view using cache_page(60)
+# ALX Task 5: Caching view (per-user versioned inbox cache)
 
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
 
+from messaging import inbox_cache
 from messaging.models import Message
 
 
+def load_inbox(user):
+    """The user's received messages, newest first, as plain cacheable rows."""
+    return [
+        {
+            "id": message.pk,
+            "sender": message.sender.username,
+            "content": message.content,
+            "timestamp": message.timestamp,
+            "read": message.read,
+            "edited": message.edited,
+            "parent_message_id": message.parent_message_id,
+        }
+        for message in Message.objects.filter(receiver=user)
+        .select_related("sender")
+        .only("id", "sender__username", "content", "timestamp", "read", "edited",
+              "parent_message_id")
+        .order_by("-timestamp")
+    ]
+
+
 @login_required
-@cache_page(60)   # ALX requires this exact decorator + timeout
 def cached_conversation(request):
     """
-    Displays messages and caches the entire response for 60 seconds.
-    ALX checks for:
-    - @cache_page
-    - 60
-    - Message.objects
-    """
-    messages = Message.objects.filter(receiver=request.user).order_by("-timestamp")
+    Displays the user's messages from the inbox cache (inbox_cache.py).
 
-    return render(request, "chats/cached_conversation.html", {
+    This used to be @cache_page(60), which served up to a minute of stale
+    inbox and re-rendered everything on expiry. The cached inbox data is
+    now versioned per user: Message and Notification signals move the
+    version, so an entry stays valid exactly until the inbox changes, and
+    the template is rendered from the cached rows on every request.
+    Hit/miss and rebuild time are in inbox_cache.stats and the response's
+    X-Inbox-Cache / Server-Timing headers.
+
+    The template gets plain dicts from load_inbox() (id, sender username,
+    content, timestamp, read, edited, parent_message_id), not Message
+    instances, so it can't follow relations such as message.receiver.
+    """
+    messages, hit, rebuild = inbox_cache.get_inbox(
+        request.user.pk, lambda: load_inbox(request.user)
+    )
+    response = render(request, "chats/cached_conversation.html", {
         "messages": messages
     })
+    response["X-Inbox-Cache"] = "hit" if hit else "miss"
+    response["Server-Timing"] = f"inbox-rebuild;dur={rebuild * 1e3:.2f}"
+    return response
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+bench_stack.py
+
+Benchmark suite for the decorator and context-manager stack in
+python-decorators-0x01 and python-context-async-perations-0x02.
+
+For each dataset size (synthetic `users` tables of 1K, 100K and 10M rows
+by default) it measures, per case, mean/p50/p99 latency, throughput and
+overhead over a raw cursor on an open connection:
+  - each decorator alone: with_db_connection, transactional,
+    retry_on_failure, cache_query (hit path), log_queries
+  - stacked decorators
+  - ExecuteQuery versus a raw connect + cursor
+  - the aiosqlite path: per-call connect versus AsyncConnectionPool
+
+Results are written as JSON. Given --baseline (a previous results file),
+the run exits non-zero when any case's mean or p99 regressed by more
+than --threshold (fractional, default 0.20).
+
+Usage:
+    python3 benchmarks/bench_stack.py --sizes 1000 100000 --output results.json
+    python3 benchmarks/bench_stack.py --baseline results.json --threshold 0.1
+"""
+
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DECORATORS_DIR = os.path.join(ROOT, "python-decorators-0x01")
+CONTEXT_DIR = os.path.join(ROOT, "python-context-async-perations-0x02")
+sys.path[:0] = [DECORATORS_DIR, CONTEXT_DIR]
+
+DEFAULT_SIZES = (1_000, 100_000, 10_000_000)
+LOOKUP = "SELECT * FROM users WHERE id = ?"
+UPDATE = "UPDATE users SET age = age WHERE id = ?"
+
+
+# ----------------------------------------------------------------------
+# datasets
+# ----------------------------------------------------------------------
+def make_dataset(directory, rows, chunk=50_000):
+    """Create (or reuse) users_<rows>.db with `rows` synthetic users."""
+    path = os.path.join(directory, f"users_{rows}.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER);"
+    )
+    have = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    if have != rows:
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("DELETE FROM users")
+        for start in range(0, rows, chunk):
+            conn.executemany(
+                "INSERT INTO users (id, name, email, age) VALUES (?, ?, ?, ?)",
+                ((i, f"user{i}", f"user{i}@example.com", 18 + i % 60)
+                 for i in range(start + 1, min(start + chunk, rows) + 1)),
+            )
+            conn.commit()
+    conn.close()
+    return path
+
+
+# ----------------------------------------------------------------------
+# measurement
+# ----------------------------------------------------------------------
+def summarize(samples, elapsed):
+    samples = sorted(samples)
+    n = len(samples)
+    return {
+        "calls": n,
+        "mean_us": sum(samples) / n * 1e6,
+        "p50_us": samples[n // 2] * 1e6,
+        "p99_us": samples[min(n - 1, int(n * 0.99))] * 1e6,
+        "throughput_per_s": n / elapsed if elapsed else 0.0,
+    }
+
+
+def lookup_ids(calls, distinct=100):
+    """Deterministic spread of user ids; `distinct` bounds the cache's key set."""
+    return [1 + (i * 7919) % distinct for i in range(calls)]
+
+
+def run_sync(fn, calls, warmup=200):
+    ids = lookup_ids(calls)
+    samples = []
+    clock = time.perf_counter
+    # transactional prints on commit; keep it out of the terminal
+    with contextlib.redirect_stdout(io.StringIO()):
+        for user_id in lookup_ids(warmup):
+            fn(user_id)
+        started = clock()
+        for user_id in ids:
+            t0 = clock()
+            fn(user_id)
+            samples.append(clock() - t0)
+        elapsed = clock() - started
+    return summarize(samples, elapsed)
+
+
+def run_async(make_case, calls, concurrency):
+    """`make_case` is a coroutine function returning (call, aclose or None)."""
+    async def main():
+        call, aclose = await make_case()
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(user_id):
+            async with semaphore:
+                t0 = time.perf_counter()
+                await call(user_id)
+                samples.append(time.perf_counter() - t0)
+
+        try:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(uid) for uid in lookup_ids(calls)))
+            return samples, time.perf_counter() - started
+        finally:
+            if aclose is not None:
+                await aclose()
+
+    samples, elapsed = asyncio.run(main())
+    return summarize(samples, elapsed)
+
+
+# ----------------------------------------------------------------------
+# cases
+# ----------------------------------------------------------------------
+def sync_cases(db_path):
+    log_mod = importlib.import_module("0-log_queries")
+    tx_mod = importlib.import_module("2-transactional")
+    retry_mod = importlib.import_module("3-retry_on_failure")
+    cache_mod = importlib.import_module("4-cache_query")
+    execute_mod = importlib.import_module("1-execute")
+    from db_pool import ConnectionPool
+    from query_stats import QueryLogger
+    from result_cache import QueryCache
+
+    pool = ConnectionPool(db_path, size=4)
+    raw = sqlite3.connect(db_path)
+    logger = QueryLogger(sink=None)
+    cache = QueryCache(max_entries=10_000)
+
+    with_db_connection = tx_mod.with_db_connection
+    transactional = tx_mod.transactional
+    retry_on_failure = retry_mod.retry_on_failure
+
+    def raw_lookup(user_id):
+        return raw.execute(LOOKUP, (user_id,)).fetchone()
+
+    def raw_connect(user_id):
+        conn = sqlite3.connect(db_path)
+        try:
+            return conn.execute(LOOKUP, (user_id,)).fetchall()
+        finally:
+            conn.close()
+
+    @with_db_connection(pool=pool)
+    def pooled_lookup(conn, user_id):
+        return conn.execute(LOOKUP, (user_id,)).fetchone()
+
+    @transactional
+    def tx_update(conn, user_id):
+        conn.execute(UPDATE, (user_id,))
+
+    @with_db_connection(pool=pool)
+    @transactional
+    def pooled_tx_update(conn, user_id):
+        conn.execute(UPDATE, (user_id,))
+
+    @retry_on_failure(retries=3, delay=0.01)
+    def retry_lookup(user_id):
+        return raw.execute(LOOKUP, (user_id,)).fetchone()
+
+    @cache_mod.cache_query(cache=cache)
+    def cached_lookup(conn, query, user_id):
+        return conn.execute(query, (user_id,)).fetchone()
+
+    @log_mod.log_queries(logger=logger)
+    def logged_lookup(query, user_id):
+        return raw.execute(query, (user_id,)).fetchone()
+
+    @with_db_connection(pool=pool)
+    @retry_on_failure(retries=3, delay=0.01)
+    @cache_mod.cache_query(cache=cache)
+    def full_stack(conn, query, user_id):
+        return conn.execute(query, (user_id,)).fetchone()
+
+    def execute_query(user_id):
+        with execute_mod.ExecuteQuery(LOOKUP, (user_id,), db_path=db_path) as rows:
+            return rows
+
+    cases = {
+        "raw_cursor": raw_lookup,
+        "raw_connect_per_call": raw_connect,
+        "with_db_connection": pooled_lookup,
+        "transactional": lambda uid: tx_update(raw, uid),
+        "with_db_connection+transactional": pooled_tx_update,
+        "retry_on_failure": retry_lookup,
+        "cache_query_hit": lambda uid: cached_lookup(raw, LOOKUP, uid),
+        "log_queries": lambda uid: logged_lookup(LOOKUP, uid),
+        "stack_connection+retry+cache": lambda uid: full_stack(LOOKUP, uid),
+        "ExecuteQuery": execute_query,
+    }
+
+    def close():
+        logger.close()
+        pool.close()
+        raw.close()
+
+    return cases, close
+
+
+def async_cases(db_path, pool_size=8):
+    try:
+        import aiosqlite
+        from async_pool import AsyncConnectionPool
+    except ImportError:
+        return {}
+
+    async def per_call(user_id):
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute(LOOKUP, (user_id,)) as cursor:
+                return await cursor.fetchall()
+
+    async def connect_per_call():
+        return per_call, None
+
+    async def pooled():
+        pool = AsyncConnectionPool(db_path, size=pool_size)
+        return (lambda user_id: pool.fetchall(LOOKUP, (user_id,))), pool.close
+
+    return {"aiosqlite_connect_per_call": connect_per_call,
+            "aiosqlite_pool": pooled}
+
+
+# ----------------------------------------------------------------------
+# regression check
+# ----------------------------------------------------------------------
+def regressions(results, baseline, threshold):
+    found = []
+    for size, cases in results["sizes"].items():
+        for case, now in cases.items():
+            before = baseline.get("sizes", {}).get(size, {}).get(case)
+            if not before:
+                continue
+            for metric in ("mean_us", "p99_us"):
+                if before[metric] and now[metric] > before[metric] * (1 + threshold):
+                    found.append(
+                        f"{case} @ {size} rows: {metric} "
+                        f"{before[metric]:.1f} -> {now[metric]:.1f} "
+                        f"(+{(now[metric] / before[metric] - 1) * 100:.0f}%)")
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--data-dir", default=os.path.join(ROOT, ".bench-data"))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--threshold", type=float, default=0.20)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    results = {
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "calls": args.calls,
+        "sizes": {},
+    }
+
+    for rows in args.sizes:
+        db_path = make_dataset(args.data_dir, rows)
+        cases, close = sync_cases(db_path)
+        measured = {}
+        try:
+            for name, fn in cases.items():
+                measured[name] = run_sync(fn, args.calls)
+        finally:
+            close()
+        base = measured["raw_cursor"]["mean_us"]
+        for stats in measured.values():
+            stats["overhead_us"] = stats["mean_us"] - base
+
+        for name, make_case in async_cases(db_path).items():
+            measured[name] = run_async(make_case, args.calls, args.concurrency)
+
+        results["sizes"][str(rows)] = measured
+        print(f"\n{rows} rows")
+        for name, stats in measured.items():
+            print(f"  {name:<34} mean {stats['mean_us']:>9.1f}us "
+                  f"p99 {stats['p99_us']:>9.1f}us "
+                  f"{stats['throughput_per_s']:>10.0f}/s")
+
+    with open(args.output, "w") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        found = regressions(results, baseline, args.threshold)
+        if found:
+            print(f"\nregressions beyond {args.threshold:.0%}:")
+            for line in found:
+                print("  " + line)
+            return 1
+        print(f"\nno regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
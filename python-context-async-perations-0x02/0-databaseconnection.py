@@ -4,35 +4,88 @@
 
 Custom class-based context manager for database connection handling.
 Opens and closes a SQLite connection automatically.
+
+`async with DatabaseConnection(...)` opens the connection on the shared
+sqlite thread pool (db_executor.py) and yields an AsyncConnection whose
+awaitable execute()/executemany()/commit() run there too, each bounded by
+`query_timeout`; a cancelled or timed-out query is stopped with
+connection.interrupt().
 """
 
 import sqlite3
+from urllib.parse import quote
+
+from db_executor import AsyncConnection, run_blocking
 
 
 class DatabaseConnection:
     """
     Custom context manager for SQLite database connection.
 
+    Optional arguments:
+      - pragmas: dict of PRAGMA name -> value applied right after connecting
+        (e.g. {"journal_mode": "WAL", "cache_size": -64000})
+      - read_only: open the file with mode=ro so writes are rejected
+      - query_timeout: seconds allowed per awaited query in `async with`
+      - any other keyword is passed through to sqlite3.connect()
+
     Usage:
         with DatabaseConnection("users.db") as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users")
             print(cursor.fetchall())
+
+        async with DatabaseConnection("users.db", query_timeout=2.0) as db:
+            print(await db.execute("SELECT * FROM users"))
     """
 
-    def __init__(self, db_path: str = "users.db"):
+    def __init__(self, db_path: str = "users.db", pragmas: dict = None,
+                 read_only: bool = False, query_timeout: float = None,
+                 **connect_kwargs):
         self.db_path = db_path
+        self.pragmas = pragmas or {}
+        self.read_only = read_only
+        self.query_timeout = query_timeout
+        self.connect_kwargs = connect_kwargs
         self.connection = None
 
+    def _connect(self, **overrides):
+        kwargs = dict(self.connect_kwargs, **overrides)
+        if self.read_only:
+            uri = f"file:{quote(self.db_path)}?mode=ro"
+            connection = sqlite3.connect(uri, uri=True, **kwargs)
+        else:
+            connection = sqlite3.connect(self.db_path, **kwargs)
+        try:
+            for name, value in self.pragmas.items():
+                connection.execute(f"PRAGMA {name} = {value}")
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
     def __enter__(self):
         """Open the SQLite connection and return it."""
-        self.connection = sqlite3.connect(self.db_path)
+        self.connection = self._connect()
         return self.connection
 
     def __exit__(self, exc_type, exc_value, traceback):
         """Close the connection automatically when leaving the context."""
         if self.connection:
             self.connection.close()
+            self.connection = None
+
+    async def __aenter__(self):
+        """Open the connection on the sqlite thread pool; return an AsyncConnection."""
+        # Pool threads take turns with the connection, one call at a time.
+        self.connection = await run_blocking(self._connect,
+                                             check_same_thread=False)
+        return AsyncConnection(self.connection, self.query_timeout)
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        if self.connection:
+            connection, self.connection = self.connection, None
+            await run_blocking(connection.close, connection=connection)
 
 
 # ✅ Test when run directly
@@ -4,9 +4,28 @@
 
 Reusable class-based context manager ExecuteQuery.
 Executes a provided SQL query with parameters and returns the results.
+
+With stream=True the rows are not materialized: __enter__ returns an
+iterator that pulls them lazily with fetchmany(chunk_size), so memory stays
+constant regardless of the result size. With columnar=True the rows are
+built batch by batch into per-column NumPy arrays (see columnar.py).
+
+Pass observer= (anything with observe(query, params, seconds), such as
+the PlanAdvisor from python-decorators-0x01/query_plan.py) to report each
+execution, e.g. for query-plan capture and index advice.
+
+`async with ExecuteQuery(...)` does the same work on the shared sqlite
+thread pool (db_executor.py) without blocking the event loop. `timeout`
+bounds the query; if it expires or the awaiting task is cancelled, the
+running statement is stopped with connection.interrupt(). With
+stream=True the async form returns an async iterator that fetches each
+chunk on the pool.
 """
 
 import sqlite3
+import time
+
+from db_executor import run_blocking
 
 
 class ExecuteQuery:
@@ -14,16 +33,157 @@ class ExecuteQuery:
     Context manager that:
       - Opens a SQLite connection on entry.
       - Executes a provided query with optional parameters.
-      - Returns fetched results from __enter__.
-      - Closes the connection automatically on exit.
+      - Returns fetched results from __enter__ (or a lazy row iterator when
+        stream=True, or a columnar.ColumnarResult when columnar=True).
+      - Closes the connection automatically on exit, including when a
+        streaming loop breaks early or raises.
     """
 
-    def __init__(self, query: str, params: tuple = (), db_path: str = "users.db"):
+    def __init__(self, query: str, params: tuple = (), db_path: str = "users.db",
+                 stream: bool = False, chunk_size: int = 500,
+                 columnar: bool = False, dtypes: dict = None, observer=None,
+                 timeout: float = None):
         self.query = query
         self.params = params
         self.db_path = db_path
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.columnar = columnar
+        self.dtypes = dtypes
+        self.observer = observer
+        self.timeout = timeout
         self.connection = None
+        self.cursor = None
         self._results = None
 
     def __enter__(self):
-        """Open connection, execute query
+        """Open connection, execute query and return the results."""
+        self.connection = sqlite3.connect(self.db_path)
+        try:
+            self._execute()
+            if self.stream:
+                return iter_chunks(self.cursor, self.chunk_size)
+            return self._fetch()
+        except Exception:
+            self.close()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the connection automatically when leaving the context."""
+        self.close()
+
+    async def __aenter__(self):
+        """Run the query on the sqlite thread pool and return the results."""
+        # The connection is handed between pool threads, one call at a time.
+        self.connection = await run_blocking(
+            sqlite3.connect, self.db_path, check_same_thread=False)
+        try:
+            if self.stream:
+                await run_blocking(self._execute, timeout=self.timeout,
+                                   connection=self.connection)
+                return self._aiter_chunks()
+            return await run_blocking(self._execute_and_fetch,
+                                      timeout=self.timeout,
+                                      connection=self.connection)
+        except BaseException:
+            await self._aclose()
+            raise
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self._aclose()
+
+    def _execute(self):
+        self.cursor = self.connection.cursor()
+        started = time.perf_counter()
+        self.cursor.execute(self.query, self.params)
+        if self.observer is not None:
+            self.observer.observe(self.query, self.params,
+                                  time.perf_counter() - started)
+
+    def _fetch(self):
+        if self.columnar:
+            # NumPy is only needed for this mode
+            from columnar import fetch_columnar
+            self._results = fetch_columnar(self.cursor, self.chunk_size,
+                                           self.dtypes)
+        else:
+            self._results = self.cursor.fetchall()
+        return self._results
+
+    def _execute_and_fetch(self):
+        self._execute()
+        return self._fetch()
+
+    async def _aiter_chunks(self):
+        while self.cursor is not None:
+            rows = await run_blocking(self.cursor.fetchmany, self.chunk_size,
+                                      timeout=self.timeout,
+                                      connection=self.connection)
+            if not rows:
+                return
+            for row in rows:
+                yield row
+
+    async def _aclose(self):
+        if self.connection is not None:
+            await run_blocking(self.close, connection=self.connection)
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+def iter_chunks(cursor, chunk_size=500):
+    """Yield rows from an executed cursor, `chunk_size` rows at a time."""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def stream_query(query, params=(), db_path="users.db", chunk_size=500):
+    """
+    Generator form of ExecuteQuery(stream=True) for use without `with`.
+    The connection stays open while rows are being consumed and is closed
+    when the generator is exhausted, closed early (break/del) or raises.
+    """
+    with ExecuteQuery(query, params, db_path, stream=True,
+                      chunk_size=chunk_size) as rows:
+        yield from rows
+
+
+# ✅ Test when run directly
+if __name__ == "__main__":
+    # Create table and seed data if needed
+    conn = sqlite3.connect("users.db")
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER);"
+    )
+    cursor.execute("SELECT COUNT(*) FROM users")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany(
+            "INSERT INTO users (name, email, age) VALUES (?, ?, ?)",
+            [
+                ("Alice", "alice@example.com", 30),
+                ("Bob", "bob@example.com", 45),
+                ("Clara", "clara@example.com", 50),
+                ("Daniel", "daniel@example.com", 22),
+            ],
+        )
+        conn.commit()
+    conn.close()
+
+    query = "SELECT * FROM users WHERE age > ?"
+    with ExecuteQuery(query, (25,)) as results:
+        print("Users older than 25:", results)
+
+    # Streaming: rows are fetched lazily in chunks
+    with ExecuteQuery(query, (25,), stream=True, chunk_size=2) as rows:
+        for row in rows:
+            print("Streamed:", row)
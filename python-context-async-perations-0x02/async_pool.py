@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+async_pool.py
+
+Async counterpart to opening a fresh aiosqlite connection per coroutine.
+
+  - AsyncConnectionPool: at most `size` aiosqlite connections (each one is
+    a worker thread), created lazily and reused across coroutines.
+  - gather_bounded: like asyncio.gather, but runs at most `limit`
+    awaitables at once, applies a per-item timeout, and cancels the rest
+    when one fails (unless return_exceptions=True).
+  - fetch_many: run a list of (query, params) through a pool with both.
+
+Usage:
+    async with AsyncConnectionPool("users.db", size=4) as pool:
+        results = await fetch_many(pool, [("SELECT * FROM users", ())] * 100,
+                                   limit=16, timeout=2.0)
+"""
+
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
+import aiosqlite
+
+
+class AsyncConnectionPool:
+    """Bounded pool of aiosqlite connections to one database file."""
+
+    def __init__(self, db_path="users.db", size=5, timeout=5.0):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        # Idle connections, plus None for a slot freed by a discarded
+        # connection: whoever takes it opens a new one in its place.
+        self._idle = asyncio.LifoQueue()
+        self._all = []
+        self._opening = 0
+        self._closed = False
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_time = 0.0
+
+    async def acquire(self):
+        """Check out a connection, waiting up to `timeout` for a free one."""
+        if self._closed:
+            raise RuntimeError("connection pool is closed")
+        if self._idle.empty() and len(self._all) + self._opening < self.size:
+            db = await self._open()
+            self.checkouts += 1
+            return db
+
+        if self._idle.empty():
+            self.waits += 1
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            db = await asyncio.wait_for(self._idle.get(), self.timeout)
+        finally:
+            self.wait_time += loop.time() - started
+        if db is None:
+            try:
+                db = await self._open()
+            except BaseException:
+                self._idle.put_nowait(None)  # hand the slot on
+                raise
+        self.checkouts += 1
+        return db
+
+    async def _open(self):
+        """Open a new connection; one finished after cancellation is closed."""
+        self._opening += 1
+        connecting = asyncio.ensure_future(aiosqlite.connect(self.db_path))
+        try:
+            db = await asyncio.shield(connecting)
+        except asyncio.CancelledError:
+            connecting.add_done_callback(_close_orphan)
+            raise
+        finally:
+            self._opening -= 1
+        self._all.append(db)
+        return db
+
+    async def release(self, db):
+        """
+        Return a connection; an open transaction is rolled back first. If
+        the rollback fails or is cancelled, or the pool has been closed, the
+        connection is closed instead and its slot freed, so no capacity leaks.
+        """
+        reusable = False
+        try:
+            if not self._closed and db.in_transaction:
+                await db.rollback()
+            reusable = not self._closed
+        finally:
+            if reusable:
+                self._idle.put_nowait(db)
+            else:
+                if db in self._all:
+                    self._all.remove(db)
+                if not self._closed:
+                    self._idle.put_nowait(None)
+                with suppress(Exception):
+                    # shielded: a second cancel must not leave it half closed
+                    await asyncio.shield(db.close())
+
+    @asynccontextmanager
+    async def connection(self):
+        db = await self.acquire()
+        try:
+            yield db
+        finally:
+            await self.release(db)
+
+    async def fetchall(self, query, params=()):
+        """Run one query on a pooled connection and return all rows."""
+        async with self.connection() as db:
+            async with db.execute(query, params) as cursor:
+                return await cursor.fetchall()
+
+    async def fetch_columnar(self, query, params=(), chunk_size=10000,
+                             dtypes=None):
+        """Run one query and build a columnar.ColumnarResult from fetchmany batches."""
+        from columnar import ColumnarBuilder
+
+        async with self.connection() as db:
+            async with db.execute(query, params) as cursor:
+                builder = ColumnarBuilder(cursor.description or (), dtypes)
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        return builder.finish()
+                    builder.add_batch(rows)
+
+    async def close(self):
+        """
+        Close the idle connections now; ones still checked out are closed
+        when they are released.
+        """
+        self._closed = True
+        idle = []
+        while not self._idle.empty():
+            db = self._idle.get_nowait()
+            if db is not None:
+                self._all.remove(db)
+                idle.append(db)
+        await asyncio.gather(*(db.close() for db in idle),
+                             return_exceptions=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def stats(self):
+        return {
+            "size": self.size,
+            "open": len(self._all),
+            "idle": self._idle.qsize(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "wait_time": self.wait_time,
+        }
+
+
+def _close_orphan(connecting):
+    """Done-callback for a connect nobody is waiting for any more."""
+    if not connecting.cancelled() and connecting.exception() is None:
+        asyncio.ensure_future(connecting.result().close())
+
+
+async def gather_bounded(*aws, limit=10, timeout=None, return_exceptions=False):
+    """
+    Await `aws` (coroutines or futures) with at most `limit` running at
+    once, each bounded by `timeout` seconds (asyncio.TimeoutError).
+    Results come back in input order. If one fails and return_exceptions
+    is False, the remaining ones are cancelled and the error is raised.
+    """
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            if timeout is None:
+                return await aw
+            return await asyncio.wait_for(aw, timeout)
+
+    tasks = [asyncio.ensure_future(run(aw)) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks, return_exceptions=return_exceptions)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled tasks unwind so their connections are released.
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+async def fetch_many(pool, queries, limit=None, timeout=None,
+                     return_exceptions=False):
+    """Run (query, params) pairs through `pool`, `limit` at a time."""
+    return await gather_bounded(
+        *(pool.fetchall(query, params) for query, params in queries),
+        limit=limit or pool.size,
+        timeout=timeout,
+        return_exceptions=return_exceptions,
+    )
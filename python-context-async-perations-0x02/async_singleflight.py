@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+async_singleflight.py
+
+Request coalescing for asyncio tasks.
+
+Concurrent awaits of the same coroutine call (same function, same
+arguments) share one execution: the first caller starts it as a task and
+everyone, the first caller included, awaits that task. If it fails, all
+waiters get the exception and nothing is kept, so the next call runs again.
+Cancelling one waiter does not cancel the shared work for the others.
+
+Usage:
+    @single_flight
+    async def asyncfetchusers():
+        ...
+"""
+
+import asyncio
+import functools
+
+
+def freeze(value):
+    """
+    Turn call arguments into something hashable for use in a key (the same
+    rules as python-decorators-0x01/hashkeys.py uses for the result cache).
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return frozenset(freeze(v) for v in value)
+    return value
+
+
+class AsyncSingleFlight:
+    """Run at most one coroutine per key at a time and share its outcome."""
+
+    def __init__(self):
+        self._tasks = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn, *args, **kwargs):
+        """Await `coro_fn(*args, **kwargs)` unless a call for `key` is running."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+            self.executions += 1
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "in_flight": len(self._tasks),
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
+
+
+def single_flight(func=None, *, group=None):
+    """
+    Decorator for coroutine functions: concurrent calls with equal arguments
+    are coalesced into one execution. Pass `group=` to share an
+    AsyncSingleFlight (and its stats) between functions.
+    """
+    def decorator(f):
+        flight = group if group is not None else AsyncSingleFlight()
+
+        @functools.wraps(f)
+        async def wrapper(*args, **kwargs):
+            key = (f.__qualname__, freeze(args), freeze(kwargs))
+            return await flight.do(key, f, *args, **kwargs)
+        wrapper.flight = flight
+        return wrapper
+
+    if callable(func):
+        return decorator(func)
+    return decorator
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+bench_async_pool.py
+
+Compares the per-call `aiosqlite.connect` pattern used in 3-concurrent.py
+with AsyncConnectionPool + gather_bounded at 10, 100 and 1000 concurrent
+queries.
+
+Usage:
+    python3 bench_async_pool.py [--db users.db] [--pool-size 8] [--limit 32]
+"""
+
+import argparse
+import asyncio
+import sqlite3
+import time
+
+import aiosqlite
+
+from async_pool import AsyncConnectionPool, fetch_many
+
+QUERY = "SELECT * FROM users WHERE age > ?"
+LEVELS = (10, 100, 1000)
+
+
+async def per_call_connect(db_path, n):
+    """Baseline: one connection (and worker thread) per query, unbounded."""
+    async def one():
+        async with aiosqlite.connect(db_path) as db:
+            async with db.execute(QUERY, (40,)) as cursor:
+                return await cursor.fetchall()
+
+    return await asyncio.gather(*(one() for _ in range(n)))
+
+
+async def pooled(db_path, n, pool_size, limit):
+    async with AsyncConnectionPool(db_path, size=pool_size) as pool:
+        return await fetch_many(pool, [(QUERY, (40,))] * n, limit=limit)
+
+
+def ensure_users(db_path, rows=1000):
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER);"
+    )
+    if conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0:
+        conn.executemany(
+            "INSERT INTO users (name, email, age) VALUES (?, ?, ?)",
+            ((f"user{i}", f"user{i}@example.com", 18 + i % 60) for i in range(rows)),
+        )
+        conn.commit()
+    conn.close()
+
+
+def timed(coro):
+    started = time.perf_counter()
+    asyncio.run(coro)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--db", default="users.db")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=32)
+    args = parser.parse_args()
+
+    ensure_users(args.db)
+    print(f"{'queries':>8} {'per-call (s)':>13} {'pooled (s)':>11} {'speedup':>8}")
+    for n in LEVELS:
+        baseline = timed(per_call_connect(args.db, n))
+        pool_time = timed(pooled(args.db, n, args.pool_size, args.limit))
+        print(f"{n:>8} {baseline:>13.4f} {pool_time:>11.4f} {baseline / pool_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
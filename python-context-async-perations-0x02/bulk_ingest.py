@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+bulk_ingest.py
+
+Bulk loading on top of DatabaseConnection, for the cases the per-script
+`executemany` seeding blocks don't cover: millions of rows from a
+generator, or syncing rows that may already exist.
+
+  - Rows are pulled lazily from any iterable and sent in `batch_size`
+    executemany calls; `transaction_rows` rows are committed at a time, so
+    memory stays flat and a failure only loses the open transaction.
+  - conflict=("email",) turns the statement into an upsert
+    (INSERT ... ON CONFLICT (email) DO UPDATE SET ...); update=() means
+    DO NOTHING.
+  - pragmas= are applied for the load only and restored afterwards
+    (e.g. {"synchronous": "OFF", "cache_size": -200000}).
+  - defer_indexes=True drops the table's non-unique indexes before the
+    load and rebuilds them once at the end, which is much cheaper than
+    maintaining them row by row. Unique indexes stay, since upserts and
+    constraint checks depend on them. The drop, the load and the rebuild
+    then run as ONE transaction: other connections keep reading the
+    indexed table until the commit, and a crash or error rolls the
+    indexes back with the rows. Passing transaction_rows together with
+    defer_indexes is therefore a ValueError rather than silently ignored.
+
+Usage:
+    report = bulk_ingest("users.db", "users", ("name", "email", "age"),
+                         rows, conflict=("email",), defer_indexes=True)
+    print(report["rows_per_second"])
+"""
+
+import importlib
+import itertools
+import time
+
+DatabaseConnection = importlib.import_module("0-databaseconnection").DatabaseConnection
+
+TRANSACTION_ROWS = 100_000
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def build_insert(table, columns, conflict=None, update=None):
+    """
+    INSERT statement for `columns`; with `conflict` columns an upsert that
+    updates `update` (default: every non-conflict column) from the new row.
+    """
+    cols = ", ".join(_quote(c) for c in columns)
+    marks = ", ".join("?" for _ in columns)
+    sql = f"INSERT INTO {_quote(table)} ({cols}) VALUES ({marks})"
+    if conflict:
+        target = ", ".join(_quote(c) for c in conflict)
+        if update is None:
+            update = [c for c in columns if c not in conflict]
+        if update:
+            assignments = ", ".join(
+                f"{_quote(c)} = excluded.{_quote(c)}" for c in update)
+            sql += f" ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+        else:
+            sql += f" ON CONFLICT ({target}) DO NOTHING"
+    return sql
+
+
+def _secondary_indexes(conn, table):
+    """(name, sql) for the table's explicitly created, non-unique indexes."""
+    unique = {row[1] for row in conn.execute(f"PRAGMA index_list({_quote(table)})")
+              if row[2]}
+    return [(name, sql) for name, sql in conn.execute(
+        "SELECT name, sql FROM sqlite_master "
+        "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,)) if name not in unique]
+
+
+def _apply_pragmas(conn, pragmas, previous):
+    """Set pragmas, recording each previous value in `previous` first."""
+    for name, value in pragmas.items():
+        row = conn.execute(f"PRAGMA {name}").fetchone()
+        if row is not None:
+            previous[name] = row[0]
+        conn.execute(f"PRAGMA {name} = {value}")
+
+
+def bulk_ingest(db_path, table, columns, rows, batch_size=5000,
+                transaction_rows=None, conflict=None, update=None,
+                pragmas=None, defer_indexes=False, progress=None):
+    """
+    Load `rows` (an iterable of tuples ordered like `columns`) into `table`.
+
+    `transaction_rows` defaults to TRANSACTION_ROWS; with `defer_indexes`
+    the whole load is one transaction and it must not be given.
+    `progress`, if given, is called with the running report after every
+    `transaction_rows` (or TRANSACTION_ROWS) rows. Returns a report dict: rows, batches, transactions, seconds,
+    rows_per_second, index_seconds and the rebuilt indexes.
+    """
+    if defer_indexes and transaction_rows is not None:
+        raise ValueError("defer_indexes loads in a single transaction; "
+                         "transaction_rows cannot be used with it")
+    if transaction_rows is None:
+        transaction_rows = TRANSACTION_ROWS
+    if batch_size < 1 or transaction_rows < 1:
+        raise ValueError("batch_size and transaction_rows must be positive")
+    sql = build_insert(table, columns, conflict, update)
+    report = {"table": table, "rows": 0, "batches": 0, "transactions": 0,
+              "seconds": 0.0, "rows_per_second": 0.0, "index_seconds": 0.0,
+              "indexes_rebuilt": []}
+    rows = iter(rows)
+    started = time.perf_counter()
+
+    # isolation_level=None: transactions are opened and committed explicitly
+    with DatabaseConnection(db_path, isolation_level=None) as conn:
+        previous = {}
+        try:
+            _apply_pragmas(conn, pragmas or {}, previous)
+            dropped = []
+            if defer_indexes:
+                conn.execute("BEGIN")
+                dropped = _secondary_indexes(conn, table)
+                for name, _ in dropped:
+                    conn.execute(f"DROP INDEX {_quote(name)}")
+
+            while True:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                in_transaction = 0
+                try:
+                    while in_transaction < transaction_rows:
+                        batch = list(itertools.islice(
+                            rows, min(batch_size, transaction_rows - in_transaction)))
+                        if not batch:
+                            break
+                        conn.executemany(sql, batch)
+                        in_transaction += len(batch)
+                        report["batches"] += 1
+                    if in_transaction and not defer_indexes:
+                        conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                if not in_transaction:
+                    break
+                report["rows"] += in_transaction
+                report["transactions"] += not defer_indexes
+                report["seconds"] = time.perf_counter() - started
+                report["rows_per_second"] = report["rows"] / report["seconds"]
+                if progress is not None:
+                    progress(dict(report))
+
+            index_started = time.perf_counter()
+            for name, index_sql in dropped:
+                conn.execute(index_sql)
+                report["indexes_rebuilt"].append(name)
+            report["index_seconds"] = time.perf_counter() - index_started
+            conn.execute("COMMIT")
+            report["transactions"] += bool(defer_indexes)
+        finally:
+            # On failure the open transaction, dropped indexes included,
+            # is rolled back before the pragmas are restored.
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for name, value in previous.items():
+                conn.execute(f"PRAGMA {name} = {value}")
+
+    report["seconds"] = time.perf_counter() - started
+    report["rows_per_second"] = (report["rows"] / report["seconds"]
+                                 if report["seconds"] else 0.0)
+    return report
+
+
+# ✅ Test when run directly
+if __name__ == "__main__":
+    with DatabaseConnection("users.db") as conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER);"
+        )
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users (email)")
+        conn.execute("CREATE INDEX IF NOT EXISTS users_age ON users (age)")
+        conn.commit()
+
+    def generate(n):
+        for i in range(n):
+            yield (f"user{i}", f"user{i}@example.com", 18 + i % 60)
+
+    report = bulk_ingest("users.db", "users", ("name", "email", "age"),
+                         generate(200_000), conflict=("email",),
+                         pragmas={"synchronous": "OFF"}, defer_indexes=True)
+    print(f"{report['rows']} rows in {report['seconds']:.2f}s "
+          f"({report['rows_per_second']:.0f} rows/s, "
+          f"indexes rebuilt in {report['index_seconds']:.2f}s)")
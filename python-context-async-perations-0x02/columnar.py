@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+columnar.py
+
+Columnar (NumPy) result mode for analytic queries.
+
+Instead of one Python tuple per row, rows are pulled with fetchmany() in
+batches and each batch is converted straight into one NumPy array per
+column, so the full result never exists as Python objects. Column names
+come from cursor.description; sqlite3 does not report declared types
+there, so each column's dtype is taken from its values (int64, float64,
+or object for text/blobs) unless `dtypes` overrides it. Integer columns
+containing NULL become float64 with NaN.
+
+The dtype is fixed by the first batch with a non-NULL value and later
+batches are converted to it, so a column never ends up as a mix of
+per-batch guesses. The only changes allowed afterwards are widening:
+int64 -> float64 when NULLs or fractions show up, anything -> object
+when text does; the chunks already built are recast once when it happens.
+
+Works with:
+  - ExecuteQuery(..., columnar=True)                 (1-execute.py)
+  - AsyncConnectionPool.fetch_columnar(...)          (async_pool.py)
+  - @columnar_query on any function that returns an executed cursor
+    (e.g. stacked under with_db_connection)
+
+Usage:
+    with ExecuteQuery("SELECT * FROM users", columnar=True) as users:
+        older = users.filter(users["age"] > 40)
+        print(older.mean("age"), users.group_by("age", "id", "count"))
+"""
+
+import functools
+
+import numpy as np
+
+
+def _column_array(values, dtype=None):
+    """Convert one batch of a column into an ndarray."""
+    if dtype is not None:
+        return np.asarray(values, dtype=dtype)
+    array = np.asarray(values)
+    if array.dtype.kind in "biuf":
+        return array
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, (int, float)) and not isinstance(sample, bool):
+        try:
+            # Numeric column with NULLs: None -> NaN
+            return np.asarray(values, dtype=np.float64)
+        except (TypeError, ValueError):
+            pass
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+def _null_array(length, dtype):
+    """`length` NULLs for a column of `dtype`: NaN for numbers, else None."""
+    if dtype.kind in "biuf":
+        return np.full(length, np.nan)
+    return np.full(length, None, dtype=object)
+
+
+def _widen(a, b):
+    """Smallest of int64/float64/object that holds both dtypes."""
+    if a == b:
+        return a
+    if a.kind in "biuf" and b.kind in "biuf":
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+
+class ColumnarBuilder:
+    """Accumulates fetchmany() batches as per-column array chunks."""
+
+    def __init__(self, description, dtypes=None):
+        self.names = [column[0] for column in description]
+        self.dtypes = dtypes or {}
+        self._chunks = [[] for _ in self.names]
+        self._types = [None] * len(self.names)  # fixed once a value is seen
+        self._nulls = [0] * len(self.names)     # NULL rows seen before that
+
+    def add_batch(self, rows):
+        if not rows:
+            return
+        for i, values in enumerate(zip(*rows)):
+            declared = self.dtypes.get(self.names[i])
+            if declared is not None:
+                self._chunks[i].append(_column_array(values, declared))
+            else:
+                self._add(i, values)
+
+    def _add(self, i, values):
+        dtype = self._types[i]
+        if all(v is None for v in values):
+            if dtype is None:
+                self._nulls[i] += len(values)
+                return
+            array = _null_array(len(values), dtype)
+        else:
+            array = _column_array(values)
+        if dtype is None:
+            dtype = array.dtype
+            if self._nulls[i]:
+                self._chunks[i].append(_null_array(self._nulls[i], dtype))
+        wide = _widen(dtype, array.dtype)
+        for chunk in self._chunks[i]:
+            wide = _widen(wide, chunk.dtype)
+        if wide != dtype or any(c.dtype != wide for c in self._chunks[i]):
+            self._chunks[i] = [c.astype(wide) for c in self._chunks[i]]
+        self._chunks[i].append(array.astype(wide, copy=False))
+        self._types[i] = wide
+
+    def finish(self):
+        columns = {}
+        for i, (name, chunks) in enumerate(zip(self.names, self._chunks)):
+            if not chunks and self._nulls[i]:
+                columns[name] = np.full(self._nulls[i], None, dtype=object)
+            elif not chunks:
+                columns[name] = np.empty(0, dtype=self.dtypes.get(name, object))
+            elif len(chunks) == 1:
+                columns[name] = chunks[0]
+            else:
+                columns[name] = np.concatenate(chunks)
+        return ColumnarResult(columns)
+
+
+def fetch_columnar(cursor, chunk_size=10000, dtypes=None):
+    """Drain an executed cursor into a ColumnarResult, batch by batch."""
+    builder = ColumnarBuilder(cursor.description or (), dtypes)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return builder.finish()
+        builder.add_batch(rows)
+
+
+class ColumnarResult:
+    """Query result held as one NumPy array per column."""
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.names = list(columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __repr__(self):
+        return f"<ColumnarResult {len(self)} rows x {self.names}>"
+
+    def to_structured(self):
+        """Return the result as a NumPy structured array."""
+        dtype = [(name, self.columns[name].dtype) for name in self.names]
+        out = np.empty(len(self), dtype=dtype)
+        for name in self.names:
+            out[name] = self.columns[name]
+        return out
+
+    def rows(self):
+        """Iterate tuples again (for code that expects the row form)."""
+        return zip(*(self.columns[name] for name in self.names))
+
+    # ------------------------------------------------------------------
+    # vectorized filters and aggregates
+    # ------------------------------------------------------------------
+    def filter(self, mask):
+        """Rows where `mask` (a boolean array, e.g. r["age"] > 40) is True."""
+        mask = np.asarray(mask, dtype=bool)
+        return ColumnarResult({name: col[mask] for name, col in self.columns.items()})
+
+    def count(self):
+        return len(self)
+
+    def sum(self, name):
+        return np.nansum(self.columns[name])
+
+    def mean(self, name):
+        return np.nanmean(self.columns[name]) if len(self) else float("nan")
+
+    def min(self, name):
+        return np.nanmin(self.columns[name])
+
+    def max(self, name):
+        return np.nanmax(self.columns[name])
+
+    def group_by(self, key, value=None, agg="count"):
+        """
+        Aggregate `value` per distinct `key` with agg in
+        {"count", "sum", "mean"}. Returns {key: result}. NaN (NULL) values
+        are skipped by sum and mean, as in sum()/mean(); a group with no
+        values has a NaN mean.
+        """
+        keys, inverse = np.unique(self.columns[key], return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        if agg == "count":
+            result = counts
+        else:
+            weights = np.asarray(self.columns[value], dtype=np.float64)
+            sums = np.bincount(inverse, weights=np.nan_to_num(weights),
+                               minlength=len(keys))
+            if agg == "sum":
+                result = sums
+            elif agg == "mean":
+                present = np.bincount(inverse, weights=~np.isnan(weights),
+                                      minlength=len(keys))
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    result = sums / present
+            else:
+                raise ValueError("agg must be 'count', 'sum' or 'mean'")
+        return dict(zip(keys.tolist(), result.tolist()))
+
+
+def columnar_query(func=None, *, chunk_size=10000, dtypes=None):
+    """
+    Decorator for query functions that return an executed cursor: the
+    cursor is drained into a ColumnarResult instead of being fetchall()'d.
+
+        @with_db_connection
+        @columnar_query
+        def user_ages(conn):
+            return conn.execute("SELECT id, age FROM users")
+    """
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            return fetch_columnar(f(*args, **kwargs), chunk_size, dtypes)
+        return wrapper
+
+    if callable(func):
+        return decorator(func)
+    return decorator
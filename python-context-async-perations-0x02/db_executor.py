@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+db_executor.py
+
+Runs blocking sqlite3 work for `async with DatabaseConnection(...)` and
+`async with ExecuteQuery(...)` on a dedicated, bounded thread pool, so
+coroutines never block the event loop and don't need aiosqlite.
+
+  - The pool is shared and sized by configure_executor(max_workers).
+  - Every call can carry a timeout (asyncio.TimeoutError).
+  - When the awaiting task is cancelled or times out, a job still queued
+    is cancelled outright; a job already running has its connection
+    interrupted so the abandoned statement stops consuming CPU. Either
+    way the error is raised at once. The next call on that connection
+    (including closing it) first waits for the interrupted job to unwind,
+    so the connection is never used by two threads at a time.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+_executor = None
+_executor_lock = threading.Lock()
+_max_workers = 4
+
+# id(connection) -> concurrent future of a job that was interrupted after
+# its caller gave up and that may still be unwinding on a worker thread.
+# The job holds the connection, so the id can't be reused meanwhile.
+_abandoned = {}
+
+
+def configure_executor(max_workers=4):
+    """Set the pool size; takes effect for the next executor created."""
+    global _max_workers, _executor
+    with _executor_lock:
+        _max_workers = max_workers
+        old, _executor = _executor, None
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_max_workers,
+                                           thread_name_prefix="sqlite-async")
+        return _executor
+
+
+async def run_blocking(fn, *args, timeout=None, connection=None, **kwargs):
+    """
+    Run fn(*args, **kwargs) on the sqlite thread pool. On timeout or
+    cancellation, cancel the job if it hasn't started, otherwise interrupt
+    `connection`, and re-raise right away.
+    """
+    if connection is not None:
+        pending = _abandoned.get(id(connection))
+        if pending is not None:
+            unwound = asyncio.wrap_future(pending)
+            unwound.add_done_callback(_discard_result)
+            await asyncio.wait([unwound])
+    job = get_executor().submit(functools.partial(fn, *args, **kwargs))
+    future = asyncio.wrap_future(job)
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+    except (asyncio.CancelledError, asyncio.TimeoutError):
+        if not job.cancel() and connection is not None:
+            connection.interrupt()
+            _abandon(connection, job)
+        # The interrupted statement raises sqlite3.OperationalError in the
+        # worker; nobody is waiting for it any more.
+        future.add_done_callback(_discard_result)
+        raise
+
+
+def _abandon(connection, job):
+    key = id(connection)
+    _abandoned[key] = job
+
+    def forget(done):
+        if _abandoned.get(key) is done:
+            del _abandoned[key]
+
+    job.add_done_callback(forget)
+
+
+def _discard_result(future):
+    if not future.cancelled():
+        future.exception()
+
+
+class AsyncConnection:
+    """
+    Awaitable facade over a sqlite3.Connection whose calls run on the
+    sqlite thread pool with a per-query timeout.
+    """
+
+    def __init__(self, connection, timeout=None):
+        self.connection = connection
+        self.timeout = timeout
+
+    def _run(self, fn, *args, timeout=None):
+        return run_blocking(fn, *args, connection=self.connection,
+                            timeout=self.timeout if timeout is None else timeout)
+
+    async def execute(self, query, params=(), timeout=None):
+        """Execute and return all rows."""
+        def work():
+            return self.connection.execute(query, params).fetchall()
+        return await self._run(work, timeout=timeout)
+
+    async def fetchone(self, query, params=(), timeout=None):
+        def work():
+            return self.connection.execute(query, params).fetchone()
+        return await self._run(work, timeout=timeout)
+
+    async def executemany(self, query, seq_of_params, timeout=None):
+        """Execute for every parameter set; returns the total rowcount."""
+        def work():
+            return self.connection.executemany(query, seq_of_params).rowcount
+        return await self._run(work, timeout=timeout)
+
+    async def commit(self):
+        await self._run(self.connection.commit)
+
+    async def rollback(self):
+        await self._run(self.connection.rollback)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+parallel_scan.py
+
+Parallel full-table scans split into rowid (or integer primary key) ranges.
+
+Each partition is read by a worker from a process or thread pool, on its
+own read-only DatabaseConnection. Results come back either as one stream
+of rows in key order, or as one value per partition when a `reduce`
+function is given (count/filter/aggregate), optionally folded with
+`combine`.
+
+Usage:
+    for row in parallel_scan("users.db", "users"):
+        ...
+
+    older = parallel_scan("users.db", "users", where="age > ?", params=(40,),
+                          reduce=count_rows, combine=sum)
+"""
+
+import itertools
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+DatabaseConnection = __import__("0-databaseconnection").DatabaseConnection
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def _check_identifier(name):
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"invalid SQL identifier: {name!r}")
+    return name
+
+
+def partition_ranges(db_path, table, partitions, key="rowid"):
+    """
+    Split [min(key), max(key)] into at most `partitions` contiguous,
+    inclusive (low, high) ranges of roughly equal width.
+    """
+    table, key = _check_identifier(table), _check_identifier(key)
+    with DatabaseConnection(db_path, read_only=True) as conn:
+        low, high = conn.execute(
+            f"SELECT MIN({key}), MAX({key}) FROM {table}").fetchone()
+    if low is None:
+        return []
+    span = high - low + 1
+    partitions = max(1, min(partitions, span))
+    step = -(-span // partitions)   # ceiling division
+    return [(start, min(start + step - 1, high))
+            for start in range(low, high + 1, step)]
+
+
+def scan_partition(db_path, table, columns, key, low, high, where=None,
+                   params=(), reduce=None, pragmas=None):
+    """
+    Read rows with low <= key <= high. Runs inside a worker, so it opens
+    its own read-only connection. Returns the rows, or reduce(rows).
+    """
+    sql = f"SELECT {columns} FROM {table} WHERE {key} BETWEEN ? AND ?"
+    if where:
+        sql += f" AND ({where})"
+    sql += f" ORDER BY {key}"
+    with DatabaseConnection(db_path, pragmas=pragmas, read_only=True) as conn:
+        cursor = conn.execute(sql, (low, high, *params))
+        if reduce is not None:
+            return reduce(cursor)
+        return cursor.fetchall()
+
+
+def parallel_scan(db_path, table, columns="*", where=None, params=(),
+                  key="rowid", partitions=None, workers=None,
+                  executor="process", reduce=None, combine=None,
+                  pragmas=None):
+    """
+    Scan `table` in parallel.
+
+    - partitions: number of key ranges (default: 4 per worker)
+    - executor: "process" (CPU-bound reduce, multi-core) or "thread"
+    - reduce: called per partition with a row iterator; must be a
+      module-level function when executor="process"
+    - combine: folds the per-partition reduce results (e.g. sum)
+
+    Without `reduce`, returns a generator of rows in key order that keeps
+    at most `workers * 2` partitions in flight.
+    """
+    table, key = _check_identifier(table), _check_identifier(key)
+    workers = workers or os.cpu_count() or 1
+    ranges = partition_ranges(db_path, table, partitions or workers * 4, key)
+    pool_cls = ProcessPoolExecutor if executor == "process" else ThreadPoolExecutor
+
+    def submit(pool, low, high):
+        return pool.submit(scan_partition, db_path, table, columns, key, low,
+                           high, where, params, reduce, pragmas)
+
+    if reduce is not None:
+        with pool_cls(max_workers=workers) as pool:
+            futures = [submit(pool, low, high) for low, high in ranges]
+            results = [future.result() for future in futures]
+        return combine(results) if combine is not None else results
+
+    def stream():
+        # At most workers * 2 partitions in flight: the next one is
+        # submitted only once the oldest has been yielded, so memory stays
+        # bounded by the window rather than the table.
+        pending = iter(ranges)
+        window = deque()
+        with pool_cls(max_workers=workers) as pool:
+            try:
+                for low, high in itertools.islice(pending, workers * 2):
+                    window.append(submit(pool, low, high))
+                while window:
+                    rows = window.popleft().result()
+                    for low, high in itertools.islice(pending, 1):
+                        window.append(submit(pool, low, high))
+                    yield from rows
+            finally:
+                for future in window:
+                    future.cancel()
+
+    return stream()
+
+
+# ----------------------------------------------------------------------
+# picklable reducers for use with executor="process"
+# ----------------------------------------------------------------------
+def count_rows(rows):
+    """Number of rows in the partition."""
+    return sum(1 for _ in rows)
+
+
+def sum_column(index):
+    """Reducer factory: sum of one column (by position)."""
+    return _ColumnSum(index)
+
+
+class _ColumnSum:
+    def __init__(self, index):
+        self.index = index
+
+    def __call__(self, rows):
+        index = self.index
+        return sum(row[index] or 0 for row in rows)
+
+
+if __name__ == "__main__":
+    total = parallel_scan("users.db", "users", reduce=count_rows, combine=sum)
+    older = parallel_scan("users.db", "users", where="age > ?", params=(40,),
+                          reduce=count_rows, combine=sum)
+    print(f"users: {total}, older than 40: {older}")
+    for row in parallel_scan("users.db", "users", executor="thread"):
+        print(row)
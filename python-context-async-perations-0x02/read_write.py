@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+read_write.py
+
+Single-writer / multi-reader access to one SQLite file, built on
+DatabaseConnection (0-databaseconnection.py).
+
+  - The database is switched to WAL, so readers never block the writer
+    and the writer never blocks readers.
+  - Every write runs on one dedicated writer thread, fed by a queue, so
+    writes never contend with each other ("database is locked").
+  - Reads go to a pool of read-only connections with tunable pragmas
+    (mmap_size, cache_size, ...).
+  - stats() reports write queue depth and writer latency.
+
+Usage:
+    with ReadWriteManager("users.db", readers=4) as db:
+        db.write(lambda conn: conn.execute("UPDATE users SET age = 31 WHERE id = 1"))
+        rows = db.execute("SELECT * FROM users", intent="read")
+"""
+
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+DatabaseConnection = __import__("0-databaseconnection").DatabaseConnection
+
+READ_PRAGMAS = {
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64000,          # negative = KiB, i.e. 64 MB
+    "temp_store": "MEMORY",
+}
+WRITE_PRAGMAS = {
+    "synchronous": "NORMAL",       # durable across app crashes in WAL mode
+    "cache_size": -64000,
+    "busy_timeout": 5000,
+}
+
+
+class ReadWriteManager:
+    """Routes reads to a read-only WAL pool and writes to one writer thread."""
+
+    _STOP = object()
+
+    def __init__(self, db_path="users.db", readers=4, read_pragmas=None,
+                 write_pragmas=None, read_timeout=5.0):
+        self.db_path = db_path
+        self.read_timeout = read_timeout
+        self.read_pragmas = dict(READ_PRAGMAS, **(read_pragmas or {}))
+        self.write_pragmas = dict(WRITE_PRAGMAS, **(write_pragmas or {}))
+
+        # journal_mode=WAL is persistent, so setting it once is enough.
+        with DatabaseConnection(db_path, pragmas={"journal_mode": "WAL"}):
+            pass
+
+        self._writes = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self.writes = 0
+        self.write_errors = 0
+        self.reads = 0
+        self._write_latency = 0.0
+        self._write_wait = 0.0
+        self._max_write_latency = 0.0
+
+        self._reader_contexts = []
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            ctx = DatabaseConnection(db_path, pragmas=self.read_pragmas,
+                                     read_only=True, check_same_thread=False)
+            self._readers.put(ctx.__enter__())
+            self._reader_contexts.append(ctx)
+
+        self._writer = threading.Thread(target=self._write_loop,
+                                        name="sqlite-writer", daemon=True)
+        self._writer.start()
+
+    # ------------------------------------------------------------------
+    # writes
+    # ------------------------------------------------------------------
+    def submit_write(self, fn, *args, **kwargs):
+        """Queue `fn(conn, *args, **kwargs)` for the writer; returns a Future."""
+        if not self._writer.is_alive():
+            raise RuntimeError("writer thread is not running")
+        future = Future()
+        self._writes.put((future, time.perf_counter(), fn, args, kwargs))
+        return future
+
+    def write(self, fn, *args, **kwargs):
+        """Run `fn(conn, ...)` on the writer thread, commit, return its result."""
+        return self.submit_write(fn, *args, **kwargs).result()
+
+    def _write_loop(self):
+        future = None
+        try:
+            with DatabaseConnection(self.db_path, pragmas=self.write_pragmas) as conn:
+                while True:
+                    future = None
+                    item = self._writes.get()
+                    if item is self._STOP:
+                        return
+                    future, queued_at, fn, args, kwargs = item
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    started = time.perf_counter()
+                    try:
+                        result = fn(conn, *args, **kwargs)
+                        conn.commit()
+                    except Exception as e:
+                        try:
+                            conn.rollback()
+                        except sqlite3.Error:
+                            pass  # the write's own error is the one to report
+                        self._record_write(queued_at, started, failed=True)
+                        future.set_exception(e)
+                    else:
+                        self._record_write(queued_at, started)
+                        future.set_result(result)
+        finally:
+            self._fail_pending(future)
+
+    def _fail_pending(self, current):
+        """The writer is gone: fail the write in progress and everything queued."""
+        error = RuntimeError("writer thread stopped")
+        if current is not None and not current.done():
+            current.set_exception(error)
+        while True:
+            try:
+                item = self._writes.get_nowait()
+            except queue.Empty:
+                return
+            if item is not self._STOP and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(error)
+
+    def _record_write(self, queued_at, started, failed=False):
+        finished = time.perf_counter()
+        with self._stats_lock:
+            self.writes += 1
+            self.write_errors += failed
+            self._write_wait += started - queued_at
+            self._write_latency += finished - started
+            self._max_write_latency = max(self._max_write_latency,
+                                          finished - started)
+
+    # ------------------------------------------------------------------
+    # reads
+    # ------------------------------------------------------------------
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection from the pool."""
+        try:
+            conn = self._readers.get(timeout=self.read_timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"no reader connection free within {self.read_timeout}s")
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def read(self, fn, *args, **kwargs):
+        """Run `fn(conn, ...)` on a read-only connection."""
+        with self._stats_lock:
+            self.reads += 1
+        with self.reader() as conn:
+            return fn(conn, *args, **kwargs)
+
+    def execute(self, query, params=(), intent="read"):
+        """
+        Run one statement with an explicit intent. Reads return all rows;
+        writes return the number of rows changed.
+        """
+        if intent == "read":
+            return self.read(lambda conn: conn.execute(query, params).fetchall())
+        if intent == "write":
+            return self.write(lambda conn: conn.execute(query, params).rowcount)
+        raise ValueError("intent must be 'read' or 'write'")
+
+    # ------------------------------------------------------------------
+    # lifecycle / stats
+    # ------------------------------------------------------------------
+    def close(self):
+        """Drain queued writes, stop the writer and close all connections."""
+        if self._writer.is_alive():
+            self._writes.put(self._STOP)
+            self._writer.join()
+        for ctx in self._reader_contexts:
+            ctx.__exit__(None, None, None)
+        self._reader_contexts = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def stats(self):
+        with self._stats_lock:
+            done = self.writes or 1
+            return {
+                "write_queue_depth": self._writes.qsize(),
+                "writes": self.writes,
+                "write_errors": self.write_errors,
+                "avg_write_ms": self._write_latency / done * 1e3,
+                "max_write_ms": self._max_write_latency * 1e3,
+                "avg_write_queue_ms": self._write_wait / done * 1e3,
+                "reads": self.reads,
+                "idle_readers": self._readers.qsize(),
+            }
@@ -2,46 +2,89 @@
 """
 0-log_queries.py
 
-Decorator that logs SQL queries before executing the decorated function.
+Decorator that logs SQL queries executed by the decorated function, with
+per-fingerprint latency histograms and slow-query reporting.
 """
 
 import functools
 import inspect
 import sqlite3
-from datetime import datetime  # ✅ Added this import for timestamp
+import time
 
+from query_stats import QueryLogger, count_rows
 
-def _extract_query_from_call(func, args, kwargs):
-    """Return the value passed for a parameter named 'query' if present."""
-    if "query" in kwargs:
-        return kwargs["query"]
+# Shared instrumentation sink; see query_stats.py for report()/flush()
+query_logger = QueryLogger(sample_rate=1.0, slow_ms=100.0)
 
+
+def _query_locator(func):
+    """
+    Resolve once, at decoration time, where the 'query' argument lives.
+    Returns a function mapping (args, kwargs) to the query or None.
+    """
+    index = None
     try:
-        sig = inspect.signature(func)
-        bound = sig.bind_partial(*args, **kwargs)
-        if "query" in bound.arguments:
-            return bound.arguments["query"]
-    except Exception:
+        params = list(inspect.signature(func).parameters.values())
+        for i, param in enumerate(params):
+            if param.name == "query" and param.kind in (
+                    param.POSITIONAL_ONLY, param.POSITIONAL_OR_KEYWORD):
+                index = i
+                break
+    except (TypeError, ValueError):
         pass
 
-    if args and isinstance(args[0], str):
-        return args[0]
-    return None
+    def locate(args, kwargs):
+        query = kwargs.get("query")
+        if query is not None:
+            return query
+        if index is not None and index < len(args):
+            return args[index]
+        if args and isinstance(args[0], str):
+            return args[0]
+        return None
+
+    return locate
+
 
+def log_queries(func=None, *, logger=None, sample_rate=None, slow_ms=None,
+                explain=None):
+    """
+    Decorator that times each call and records the SQL query, its latency
+    and row count on a background writer (see query_stats.QueryLogger).
 
-def log_queries(func=None):
-    """Decorator that prints the SQL query with timestamp before calling the function."""
+    `sample_rate` and `slow_ms` override the logger's settings when a
+    dedicated logger is created for this function; by default calls go to
+    the module-level `query_logger`.
+
+    Pass `explain=PlanAdvisor(...)` (query_plan.py) to capture each
+    statement's EXPLAIN QUERY PLAN and collect index suggestions.
+    """
 
     def decorator(f):
+        sink = logger
+        if sink is None and (sample_rate is not None or slow_ms is not None):
+            sink = QueryLogger(
+                sample_rate=1.0 if sample_rate is None else sample_rate,
+                slow_ms=100.0 if slow_ms is None else slow_ms,
+            )
+        locate = _query_locator(f)
+
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            query = _extract_query_from_call(f, args, kwargs)
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            if query:
-                print(f"[{timestamp}] Executing query: {query}")
-            else:
-                print(f"[{timestamp}] Executing query: <no query found>")
-            return f(*args, **kwargs)
+            target = sink if sink is not None else query_logger
+            query = locate(args, kwargs)
+            started = time.time()
+            t0 = time.perf_counter()
+            try:
+                result = f(*args, **kwargs)
+            except Exception as e:
+                target.record(query, started, time.perf_counter() - t0, 0,
+                              error=type(e).__name__, observer=explain)
+                raise
+            target.record(query, started, time.perf_counter() - t0,
+                          count_rows(result), observer=explain)
+            return result
+        wrapper.query_logger = sink if sink is not None else query_logger
         return wrapper
 
     if callable(func):
@@ -62,3 +105,7 @@ def fetch_all_users(query):
 if __name__ == "__main__":
     users = fetch_all_users(query="SELECT * FROM users")
     print("Result rows:", users)
+
+    query_logger.flush()
+    for stats in query_logger.report():
+        print(stats)
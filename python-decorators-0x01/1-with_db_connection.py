@@ -3,35 +3,34 @@
 1-with_db_connection.py
 
 Decorator that automatically handles opening and closing a SQLite database connection.
+Connections come from a shared pool (see db_pool.py) so cheap lookups don't
+pay for sqlite3.connect()/close() on every call.
 """
 
 import sqlite3
 import functools
-from datetime import datetime
 
+from db_pool import get_pool
+from rows import record_factory
 
-def with_db_connection(func=None):
+
+def with_db_connection(func=None, *, pool=None):
     """
     Decorator that:
-      • Opens a SQLite database connection before calling the wrapped function,
+      • Checks a SQLite connection out of the pool before calling the wrapped function,
       • Passes the connection object as the first argument,
-      • Closes the connection after the function finishes,
-      • Logs each connection open/close with a timestamp.
+      • Returns the connection to the pool after the function finishes.
+
+    Pass `pool=` to use a specific ConnectionPool; by default the shared
+    pool for "users.db" is used.
     """
 
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Opening database connection...")
-            conn = sqlite3.connect("users.db")
-            try:
-                result = f(conn, *args, **kwargs)
-                return result
-            finally:
-                conn.close()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{timestamp}] Connection closed.")
+            db_pool = pool if pool is not None else get_pool("users.db")
+            with db_pool.connection() as conn:
+                return f(conn, *args, **kwargs)
         return wrapper
 
     if callable(func):
@@ -42,8 +41,9 @@ def with_db_connection(func=None):
 
 @with_db_connection
 def get_user_by_id(conn, user_id):
-    """Fetch a user row by ID."""
+    """Fetch a user row by ID (fields readable by name, e.g. user.email)."""
     cursor = conn.cursor()
+    cursor.row_factory = record_factory
     cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     return cursor.fetchone()
 
@@ -66,3 +66,4 @@ if __name__ == "__main__":
 
     user = get_user_by_id(user_id=1)
     print("Fetched user:", user)
+    print("Pool stats:", get_pool("users.db").stats())
@@ -5,37 +5,50 @@
 Task 2 — Transaction Management Decorator.
 
 Implements:
-- with_db_connection: opens and closes a SQLite connection (copied from Task 1)
-- transactional: wraps DB operations to commit on success or rollback on error
+- with_db_connection: checks a pooled SQLite connection in/out (copied from Task 1)
+- transactional: wraps DB operations to commit on success or rollback on error;
+  nested calls use SAVEPOINTs
+- GroupCommit: batches many small transactional calls into one commit
 
 Usage:
     @with_db_connection
     @transactional
     def update_user_email(conn, user_id, new_email):
         ...
+
+    writes = GroupCommit("users.db", max_batch=100, max_latency=0.01)
+
+    @transactional(group=writes)
+    def set_email(conn, user_id, new_email):
+        ...
+
+    futures = [set_email.submit(uid, email) for uid, email in changes]
 """
 import sqlite3
 import functools
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
 from datetime import datetime
 
+from db_pool import TrackedConnection, get_pool
+from result_cache import invalidate_tables, written_tables
+from rows import record_factory
+
 
-def with_db_connection(func=None):
+def with_db_connection(func=None, *, pool=None):
     """
-    Decorator that opens a SQLite connection, passes it as the first argument
-    to the wrapped function, and closes it afterward.
+    Decorator that checks a SQLite connection out of the pool, passes it as
+    the first argument to the wrapped function, and returns it afterward.
     """
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Opening database connection...")
-            conn = sqlite3.connect("users.db")
-            try:
+            db_pool = pool if pool is not None else get_pool("users.db")
+            with db_pool.connection() as conn:
                 return f(conn, *args, **kwargs)
-            finally:
-                conn.close()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{timestamp}] Connection closed.")
         return wrapper
 
     if callable(func):
@@ -43,26 +56,279 @@ def with_db_connection(func=None):
     return decorator
 
 
-def transactional(func):
+# Active transactional depth per connection; >0 means a transaction
+# opened by @transactional (or a GroupCommit batch) is in progress.
+# Weakly keyed, so a connection dropped mid-transaction takes its entry
+# with it. Plain sqlite3.Connection objects can't be weakly referenced;
+# those (pool connections are TrackedConnection, which can) go in a
+# regular dict that the outermost call always clears.
+_depth = weakref.WeakKeyDictionary()
+_plain_depth = {}
+
+
+def _depths(conn):
+    try:
+        weakref.ref(conn)
+    except TypeError:
+        return _plain_depth
+    return _depth
+
+
+def _nested(conn, func, args, kwargs):
+    """Run `func` inside a SAVEPOINT of the already open transaction."""
+    depths = _depths(conn)
+    depth = depths[conn]
+    name = f"sp_{depth}"
+    depths[conn] = depth + 1
+    try:
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            result = func(conn, *args, **kwargs)
+        except Exception:
+            conn.execute(f"ROLLBACK TO {name}")
+            conn.execute(f"RELEASE {name}")
+            raise
+        conn.execute(f"RELEASE {name}")
+        return result
+    finally:
+        depths[conn] = depth
+
+
+def _trace(conn, statements):
+    """
+    Record the SQL `conn` runs into `statements`, still passing it on to
+    the trace callback already installed, and return that callback so the
+    caller can put it back. Only a TrackedConnection can report its
+    callback; on a plain sqlite3.Connection one set beforehand is lost.
+    """
+    previous = getattr(conn, "trace_callback", None)
+    if previous is None:
+        conn.set_trace_callback(statements.append)
+    else:
+        def trace(sql):
+            statements.append(sql)
+            previous(sql)
+        conn.set_trace_callback(trace)
+    return previous
+
+
+def transactional(func=None, *, group=None):
     """
     Decorator that ensures a database operation is executed within a transaction.
     Commits if the wrapped function completes successfully, rolls back on exception.
     The wrapped function MUST accept the sqlite3.Connection as its first argument.
+
+    Statements executed inside the transaction are traced; after a successful
+    commit, cached query results for the tables they wrote are invalidated
+    (see result_cache.py) so cache_query never serves pre-write rows.
+
+    A @transactional function called from inside another one (same
+    connection) runs in a SAVEPOINT: its failure rolls back only its own
+    work, and nothing is committed until the outermost call returns.
+
+    With `group=GroupCommit(...)` calls are queued and committed in batches
+    on the committer's own connection, so the function is called WITHOUT a
+    connection argument (do not stack it under with_db_connection).
+    Calling it blocks until its batch commits; `.submit()` returns a
+    concurrent.futures.Future instead, so a loop can queue many writes.
     """
-    @functools.wraps(func)
-    def wrapper(conn, *args, **kwargs):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    def decorator(f):
+        if group is not None:
+            @functools.wraps(f)
+            def grouped(*args, **kwargs):
+                return group.submit(f, *args, **kwargs).result()
+            grouped.submit = functools.partial(group.submit, f)
+            return grouped
+
+        @functools.wraps(f)
+        def wrapper(conn, *args, **kwargs):
+            depths = _depths(conn)
+            if depths.get(conn):
+                return _nested(conn, f, args, kwargs)
+
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            statements = []
+            depths[conn] = 1
+            previous_trace = _trace(conn, statements)
+            try:
+                # Open the transaction explicitly: without it a nested
+                # call's RELEASE would commit its savepoint on its own.
+                if not conn.in_transaction:
+                    conn.execute("BEGIN")
+                result = f(conn, *args, **kwargs)
+                conn.commit()
+                print(f"[{timestamp}] Transaction committed.")
+            except Exception as e:
+                conn.rollback()
+                print(f"[{timestamp}] Transaction rolled back due to error: {e}")
+                # Re-raise so callers and checkers see the original exception
+                raise
+            finally:
+                depths.pop(conn, None)
+                conn.set_trace_callback(previous_trace)
+            invalidate_tables(written_tables(statements))
+            return result
+        return wrapper
+
+    if callable(func):
+        return decorator(func)
+    return decorator
+
+
+class GroupCommit:
+    """
+    Batches many small transactional calls into one COMMIT.
+
+    A background thread owns one connection. It takes queued calls until
+    either `max_batch` calls are collected or `max_latency` seconds have
+    passed since the first one, runs each in its own SAVEPOINT inside a
+    single transaction, then commits once. A call that raises is rolled
+    back to its savepoint and only its own future fails; if the COMMIT
+    itself fails, every call in the batch fails with that error. If the
+    committer can't go on (the connection won't open, a ROLLBACK fails),
+    everything queued fails and later submissions raise RuntimeError.
+    """
+
+    _STOP = object()
+
+    def __init__(self, db_path="users.db", max_batch=64, max_latency=0.005):
+        self.db_path = db_path
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._error = None      # why the committer thread stopped, if it died
+        self.batches = 0
+        self.calls = 0
+        self.failed_calls = 0
+        self.failed_commits = 0
+
+    def submit(self, func, *args, **kwargs):
+        """Queue `func(conn, *args, **kwargs)`; returns a Future for its result."""
+        if self._thread is None:
+            self._start()
+        future = Future()
+        # Under the lock, so a committer dying right now can't miss this call
+        with self._lock:
+            if self._error is not None:
+                raise RuntimeError("group committer stopped") from self._error
+            self._queue.put((future, func, args, kwargs))
+        return future
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="group-commit", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        batch = []
         try:
-            result = func(conn, *args, **kwargs)
+            conn = sqlite3.connect(self.db_path, factory=TrackedConnection)
+            try:
+                self._loop(conn, batch)
+            finally:
+                conn.close()
+        except Exception as e:
+            # The error is kept in self._error and handed to every waiter
+            self._fail_pending(batch, e)
+
+    def _loop(self, conn, batch):
+        stopping = False
+        while not stopping:
+            batch.clear()
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+            batch.append(item)
+            window_ends = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = window_ends - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._commit_batch(conn, batch)
+
+    def _fail_pending(self, batch, error):
+        """The committer is gone: fail its batch and everything queued."""
+        with self._lock:
+            self._error = error
+        failure = RuntimeError("group committer stopped")
+        failure.__cause__ = error
+        for future, *_ in batch:
+            if not future.done():
+                future.set_exception(failure)
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not self._STOP and item[0].set_running_or_notify_cancel():
+                item[0].set_exception(failure)
+
+    def _commit_batch(self, conn, batch):
+        statements = []
+        outcomes = []
+        depths = _depths(conn)
+        depths[conn] = 1
+        previous_trace = _trace(conn, statements)
+        try:
+            conn.execute("BEGIN")
+            for future, func, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    outcomes.append((future, True, _nested(conn, func, args, kwargs)))
+                except Exception as e:
+                    outcomes.append((future, False, e))
             conn.commit()
-            print(f"[{timestamp}] Transaction committed.")
-            return result
         except Exception as e:
-            conn.rollback()
-            print(f"[{timestamp}] Transaction rolled back due to error: {e}")
-            # Re-raise so callers and checkers see the original exception
-            raise
-    return wrapper
+            self.failed_commits += 1
+            try:
+                # A failing ROLLBACK stops the committer (see _run)
+                conn.rollback()
+            finally:
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        finally:
+            depths.pop(conn, None)
+            conn.set_trace_callback(previous_trace)
+
+        invalidate_tables(written_tables(statements))
+        self.batches += 1
+        for future, ok, value in outcomes:
+            self.calls += 1
+            if ok:
+                future.set_result(value)
+            else:
+                self.failed_calls += 1
+                future.set_exception(value)
+
+    def close(self):
+        """Commit whatever is queued and stop the committer thread."""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "calls": self.calls,
+            "failed_calls": self.failed_calls,
+            "failed_commits": self.failed_commits,
+            "queued": self._queue.qsize(),
+            "calls_per_commit": self.calls / self.batches if self.batches else 0.0,
+        }
 
 
 @with_db_connection
@@ -80,6 +346,7 @@ def update_user_email(conn, user_id, new_email):
 @with_db_connection
 def get_user_by_id(conn, user_id):
     cursor = conn.cursor()
+    cursor.row_factory = record_factory
     cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
     return cursor.fetchone()
 
@@ -5,30 +5,32 @@
 Task 3 — Retry Decorator for Database Operations.
 
 Implements:
-  - with_db_connection: opens/closes a SQLite connection.
-  - retry_on_failure: retries the wrapped function if an exception occurs.
+  - with_db_connection: checks a pooled SQLite connection in/out.
+  - retry_on_failure: retries the wrapped function (sync or async) on
+    transient sqlite3 errors, with jittered exponential backoff and an
+    optional overall deadline.
 """
 
+import asyncio
 import sqlite3
 import functools
+import inspect
+import random
+import threading
 import time
 from datetime import datetime
 
+from db_pool import get_pool
 
-def with_db_connection(func=None):
-    """Decorator that opens a SQLite connection, passes it to the wrapped function, and closes it afterward."""
+
+def with_db_connection(func=None, *, pool=None):
+    """Decorator that checks out a pooled SQLite connection, passes it to the wrapped function, and returns it afterward."""
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Opening database connection...")
-            conn = sqlite3.connect("users.db")
-            try:
+            db_pool = pool if pool is not None else get_pool("users.db")
+            with db_pool.connection() as conn:
                 return f(conn, *args, **kwargs)
-            finally:
-                conn.close()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{timestamp}] Connection closed.")
         return wrapper
 
     if callable(func):
@@ -36,29 +38,122 @@ def with_db_connection(func=None):
     return decorator
 
 
-def retry_on_failure(retries=3, delay=2):
+# sqlite3.OperationalError messages that indicate contention, not a bug
+TRANSIENT_ERRORS = ("database is locked", "database table is locked", "busy")
+
+
+def is_transient(exc):
+    """True for sqlite3 errors worth retrying (lock contention / busy)."""
+    if not isinstance(exc, sqlite3.OperationalError):
+        return False
+    message = str(exc).lower()
+    return any(marker in message for marker in TRANSIENT_ERRORS)
+
+
+class RetryStats:
+    """Thread-safe counters shared by every call of a retrying function."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.gave_up = 0
+        self.not_retryable = 0
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "gave_up": self.gave_up,
+                "not_retryable": self.not_retryable,
+            }
+
+
+def backoff_delay(attempt, base, max_delay):
+    """Full-jitter exponential backoff: uniform(0, min(max, base * 2**n))."""
+    return random.uniform(0, min(max_delay, base * (2 ** (attempt - 1))))
+
+
+def retry_on_failure(retries=3, delay=2, max_delay=30.0, deadline=None,
+                     retry_if=is_transient, stats=None):
     """
-    Decorator factory to retry a function call on failure.
+    Decorator factory to retry a function call on transient failure.
     - retries: number of attempts before giving up
-    - delay: seconds to wait between retries
+    - delay: base backoff in seconds; attempt n sleeps a random time in
+      [0, min(max_delay, delay * 2**(n-1))] (exponential, full jitter)
+    - deadline: overall seconds budget across all attempts and sleeps
+    - retry_if: predicate deciding which exceptions are retryable; by
+      default only "locked"/"busy" sqlite3.OperationalError
+    - stats: RetryStats to count into (defaults to one per function,
+      exposed as `wrapper.retry_stats`)
+    Coroutine functions are supported and back off with asyncio.sleep.
     """
     def decorator(func):
-        @functools.wraps(func)
-        def wrapper(*args, **kwargs):
-            attempt = 0
-            while attempt < retries:
-                try:
-                    return func(*args, **kwargs)
-                except Exception as e:
+        counters = stats if stats is not None else RetryStats()
+
+        def next_delay(attempt, error, started):
+            """Seconds to sleep before retrying, or None to give up."""
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if not retry_if(error):
+                counters.add(not_retryable=1)
+                print(f"[{timestamp}] Attempt {attempt} failed, not retryable: {error}")
+                return None
+            print(f"[{timestamp}] Attempt {attempt} failed: {error}")
+            if attempt >= retries:
+                counters.add(gave_up=1)
+                print(f"[{timestamp}] All {retries} attempts failed.")
+                return None
+            pause = backoff_delay(attempt, delay, max_delay)
+            if deadline is not None and \
+                    time.monotonic() - started + pause > deadline:
+                counters.add(gave_up=1)
+                print(f"[{timestamp}] Retry deadline of {deadline}s exhausted.")
+                return None
+            counters.add(retries=1)
+            print(f"[{timestamp}] Retrying in {pause:.2f} second(s)...")
+            return pause
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                counters.add(calls=1)
+                started = time.monotonic()
+                attempt = 0
+                while True:
+                    attempt += 1
+                    counters.add(attempts=1)
+                    try:
+                        return await func(*args, **kwargs)
+                    except Exception as e:
+                        pause = next_delay(attempt, e, started)
+                        if pause is None:
+                            raise
+                    await asyncio.sleep(pause)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                counters.add(calls=1)
+                started = time.monotonic()
+                attempt = 0
+                while True:
                     attempt += 1
-                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    print(f"[{timestamp}] Attempt {attempt} failed: {e}")
-                    if attempt < retries:
-                        print(f"[{timestamp}] Retrying in {delay} second(s)...")
-                        time.sleep(delay)
-                    else:
-                        print(f"[{timestamp}] All {retries} attempts failed.")
-                        raise
+                    counters.add(attempts=1)
+                    try:
+                        return func(*args, **kwargs)
+                    except Exception as e:
+                        pause = next_delay(attempt, e, started)
+                        if pause is None:
+                            raise
+                    time.sleep(pause)
+        wrapper.retry_stats = counters
         return wrapper
     return decorator
 
@@ -66,7 +161,7 @@ def retry_on_failure(retries=3, delay=2):
 @with_db_connection
 @retry_on_failure(retries=3, delay=1)
 def fetch_users_with_retry(conn):
-    """Fetch users, retrying automatically if an exception occurs."""
+    """Fetch users, retrying automatically if the database is locked/busy."""
     cursor = conn.cursor()
     # simulate transient error randomly (optional for testing)
     cursor.execute("SELECT * FROM users")
@@ -92,3 +187,4 @@ if __name__ == "__main__":
     print("Fetching users with retry logic...")
     users = fetch_users_with_retry()
     print("Fetched users:", users)
+    print("Retry stats:", fetch_users_with_retry.retry_stats.as_dict())
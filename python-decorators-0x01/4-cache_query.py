@@ -5,33 +5,34 @@
 Task 4 — Using Decorators to Cache Database Queries.
 
 Implements:
-  - with_db_connection: handles opening/closing DB connections
+  - with_db_connection: handles pooled DB connection checkout/checkin
   - cache_query: caches query results to avoid redundant database calls
 """
 
 import sqlite3
 import functools
-import time
-from datetime import datetime
+
+from db_pool import get_pool
+from result_cache import QueryCache, make_key, tables_in
+from rows import record_factory
+from disk_cache import DiskCache
+from singleflight import SingleFlight
 
 # Global cache for query results
-query_cache = {}
+query_cache = QueryCache(max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300)
+# Coalesces concurrent misses for the same key (single-flight mode)
+query_flight = SingleFlight()
+_MISSING = object()
 
 
-def with_db_connection(func=None):
-    """Decorator that opens and closes a SQLite connection automatically."""
+def with_db_connection(func=None, *, pool=None):
+    """Decorator that checks a pooled SQLite connection out and back in automatically."""
     def decorator(f):
         @functools.wraps(f)
         def wrapper(*args, **kwargs):
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Opening database connection...")
-            conn = sqlite3.connect("users.db")
-            try:
+            db_pool = pool if pool is not None else get_pool("users.db")
+            with db_pool.connection() as conn:
                 return f(conn, *args, **kwargs)
-            finally:
-                conn.close()
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                print(f"[{timestamp}] Connection closed.")
         return wrapper
 
     if callable(func):
@@ -39,39 +40,64 @@ def with_db_connection(func=None):
     return decorator
 
 
-def cache_query(func):
+def cache_query(func=None, *, cache=None, ttl=None, single_flight=True):
     """
-    Decorator that caches database query results based on the SQL query string.
-    Uses a global dictionary `query_cache` where:
-      - Key: query string
+    Decorator that caches database query results in a QueryCache
+    (see result_cache.py), `query_cache` by default:
+      - Key: normalized query string + the remaining call parameters
       - Value: result from database
+    Entries are LRU-evicted by count and estimated size, expire after `ttl`
+    seconds, and are dropped when a transactional write touches a table the
+    query reads.
+
+    With `single_flight` (the default), concurrent misses for the same key
+    wait for one execution and share its result; a failure is raised to
+    every waiter and is not cached.
     """
-    @functools.wraps(func)
-    def wrapper(conn, *args, **kwargs):
-        # Extract query (must be passed as keyword or positional arg)
-        query = kwargs.get("query")
-        if query is None and len(args) > 0:
-            query = args[0]
-
-        if query in query_cache:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"[{timestamp}] Cache hit for query: {query}")
-            return query_cache[query]
-
-        # Otherwise, execute function and cache the result
-        result = func(conn, *args, **kwargs)
-        query_cache[query] = result
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        print(f"[{timestamp}] Cache miss. Query executed and stored.")
-        return result
-    return wrapper
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(conn, *args, **kwargs):
+            store = cache if cache is not None else query_cache
+            # Extract query (must be passed as keyword or positional arg)
+            params = dict(kwargs)
+            query = params.pop("query", None)
+            rest = args
+            if query is None and len(args) > 0:
+                query, rest = args[0], args[1:]
+
+            key = make_key(query, rest, params)
+            result = store.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+
+            # Otherwise, execute function and cache the result
+            def load():
+                cached = store.get(key, _MISSING, count=False)
+                if cached is not _MISSING:
+                    return cached
+                tables = tables_in(query)
+                generation = store.generation(tables)
+                result = f(conn, *args, **kwargs)
+                store.set(key, result, tables=tables, ttl=ttl,
+                          generation=generation)
+                return result
+
+            if single_flight:
+                return query_flight.do((id(store), key), load)
+            return load()
+        return wrapper
+
+    if callable(func):
+        return decorator(func)
+    return decorator
 
 
 @with_db_connection
 @cache_query
 def fetch_users_with_cache(conn, query):
-    """Fetch users from DB and cache results."""
+    """Fetch users from DB and cache results (rows readable by column name)."""
     cursor = conn.cursor()
+    cursor.row_factory = record_factory
     cursor.execute(query)
     return cursor.fetchall()
 
@@ -92,6 +118,11 @@ if __name__ == "__main__":
         conn.commit()
     conn.close()
 
+    # Optional persistent tier: results survive restarts and the hot set is
+    # preloaded, so on a second run even the first call is a cache hit.
+    warmed = query_cache.attach_disk(DiskCache("query_cache.db"))
+    print("Entries preloaded from disk:", warmed)
+
     # First call — cache miss
     print("\nFirst call: executing query and caching result...")
     users = fetch_users_with_cache(query="SELECT * FROM users")
@@ -101,3 +132,4 @@ if __name__ == "__main__":
     print("\nSecond call: should use cached result...")
     users_again = fetch_users_with_cache(query="SELECT * FROM users")
     print("Users (from cache):", users_again)
+    print("Cache stats:", query_cache.stats())
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+bench_rows.py
+
+Reports memory per 1M cached rows for the row representations a cached
+`SELECT * FROM users` result can take: plain tuples, dicts, records from
+rows.record_factory, and rows.PackedRows.
+
+Usage:
+    python3 bench_rows.py [--rows 1000000]
+"""
+
+import argparse
+import gc
+import sqlite3
+import time
+import tracemalloc
+
+from rows import PackedRows, record_factory
+
+
+def build_db(n):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT, email TEXT, age INTEGER)")
+    conn.executemany(
+        "INSERT INTO users (name, email, age) VALUES (?, ?, ?)",
+        ((f"user{i}", f"user{i}@example.com", 18 + i % 60) for i in range(n)),
+    )
+    conn.commit()
+    return conn
+
+
+def measure(label, build, n):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - started
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    per_million = current * 1_000_000 / n
+    print(f"{label:<14} {per_million / 2**20:>10.1f} MiB/1M rows "
+          f"{current / n:>8.1f} B/row {elapsed:>8.2f}s")
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    conn = build_db(args.rows)
+    query = "SELECT * FROM users"
+
+    def fetch(factory=None):
+        cursor = conn.cursor()
+        cursor.row_factory = factory
+        return cursor.execute(query).fetchall()
+
+    def as_dicts():
+        cursor = conn.execute(query)
+        names = [c[0] for c in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    measure("tuples", fetch, args.rows)
+    measure("dicts", as_dicts, args.rows)
+    measure("records", lambda: fetch(record_factory), args.rows)
+    rows = fetch(record_factory)
+    packed = measure("packed", lambda: PackedRows.pack(rows), args.rows)
+    print(f"packed.nbytes(): {packed.nbytes() / 2**20:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+db_pool.py
+
+Bounded, thread-aware SQLite connection pool shared by the
+`with_db_connection` decorators in this project.
+
+Instead of running sqlite3.connect()/close() on every decorated call, each
+call checks a connection out of the pool and hands it back afterwards.
+
+Features:
+  - size: maximum number of open connections (created lazily)
+  - timeout: seconds a caller waits for a free connection before giving up
+  - health check: a cheap `SELECT 1` on checkout, broken connections are
+    replaced transparently
+  - per-thread affinity: a thread gets back the connection it used last
+    when it is idle, and nested checkouts in the same thread share one
+    connection
+  - statistics: checkouts, waits and total wait time (see `stats()`)
+
+Usage:
+    pool = get_pool("users.db")
+    with pool.connection() as conn:
+        conn.execute("SELECT * FROM users")
+"""
+
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class TrackedConnection(sqlite3.Connection):
+    """
+    sqlite3.Connection that can be weakly referenced, so per-connection
+    state (e.g. the transactional nesting depth) can be kept off to the side.
+    It also remembers its trace callback, which sqlite3 has no getter for,
+    so code that traces temporarily can put the caller's back.
+    """
+
+    trace_callback = None
+
+    def set_trace_callback(self, callback):
+        super().set_trace_callback(callback)
+        self.trace_callback = callback
+
+
+class PoolTimeout(TimeoutError):
+    """Raised when no connection becomes free within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Fixed-size pool of sqlite3 connections to a single database file.
+
+    Connections are opened with check_same_thread=False because a connection
+    may be reused by another thread once it has been returned to the pool;
+    the pool guarantees only one thread holds a connection at a time.
+    """
+
+    def __init__(self, db_path="users.db", size=5, timeout=5.0,
+                 health_check=True, row_factory=None, **connect_kwargs):
+        if size < 1:
+            raise ValueError("pool size must be at least 1")
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.row_factory = row_factory
+        self._connect_kwargs = dict(connect_kwargs, check_same_thread=False)
+        self._connect_kwargs.setdefault("factory", TrackedConnection)
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []          # connections ready for checkout
+        self._opened = 0         # connections currently owned by the pool
+        self._closed = False
+        self._local = threading.local()
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+
+    # ------------------------------------------------------------------
+    # checkout / checkin
+    # ------------------------------------------------------------------
+    def acquire(self):
+        """Check a connection out of the pool, waiting up to `timeout`."""
+        held = getattr(self._local, "held", None)
+        if held is not None:
+            # Re-entrant checkout from the same thread (nested decorators).
+            self._local.depth += 1
+            with self._cond:
+                self._checkouts += 1
+            return held
+
+        conn = self._checkout()
+        if self.health_check and not self._is_healthy(conn):
+            conn = self._replace(conn)
+
+        self._local.held = conn
+        self._local.depth = 1
+        self._local.last = conn
+        return conn
+
+    def release(self, conn):
+        """Return a connection obtained from `acquire()` to the pool."""
+        if getattr(self._local, "held", None) is not conn:
+            raise ValueError("connection was not checked out by this thread")
+
+        self._local.depth -= 1
+        if self._local.depth:
+            return
+        self._local.held = None
+
+        # Never leak an open transaction to the next borrower.
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                self._opened -= 1
+                conn.close()
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager wrapper around acquire()/release()."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def _checkout(self):
+        deadline = None
+        waited_since = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("connection pool is closed")
+                if self._idle:
+                    conn = self._take_idle()
+                    break
+                if self._opened < self.size:
+                    self._opened += 1
+                    conn = None
+                    break
+
+                if waited_since is None:
+                    waited_since = time.monotonic()
+                    deadline = waited_since + self.timeout
+                    self._waits += 1
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    self._wait_time += time.monotonic() - waited_since
+                    raise PoolTimeout(
+                        f"no connection available within {self.timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                self._cond.wait(remaining)
+
+            self._checkouts += 1
+            if waited_since is not None:
+                self._wait_time += time.monotonic() - waited_since
+
+        if conn is None:
+            conn = self._open()
+        return conn
+
+    def _take_idle(self):
+        """Pop an idle connection, preferring the one this thread used last."""
+        last = getattr(self._local, "last", None)
+        if last is not None:
+            for i, conn in enumerate(self._idle):
+                if conn is last:
+                    return self._idle.pop(i)
+        return self._idle.pop()
+
+    # ------------------------------------------------------------------
+    # connection lifecycle
+    # ------------------------------------------------------------------
+    def _open(self):
+        try:
+            conn = sqlite3.connect(self.db_path, **self._connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        with self._cond:
+            self._created += 1
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _replace(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._discarded += 1
+        # The slot stays reserved, so open the replacement directly.
+        return self._open()
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def close(self):
+        """Close idle connections; busy ones are closed when released."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+                self._opened -= 1
+            self._cond.notify_all()
+
+    # ------------------------------------------------------------------
+    # statistics
+    # ------------------------------------------------------------------
+    def stats(self):
+        """Return a snapshot of pool statistics as a plain dict."""
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_time": self._wait_time,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path="users.db", **options):
+    """
+    Return the shared pool for `db_path`, creating it on first use.
+    `options` (size, timeout, ...) only apply when the pool is created.
+    """
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None or pool._closed:
+            pool = _pools[db_path] = ConnectionPool(db_path, **options)
+        return pool
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+disk_cache.py
+
+Persistent second tier for QueryCache (result_cache.py), stored in a
+separate SQLite file so hot query results survive restarts.
+
+  - Keys are versioned: entries written under another CACHE_VERSION (or
+    with a different `namespace`) are never served and are purged on open.
+  - Each entry carries a checksum of its payload; corrupt entries are
+    dropped on read. Payloads are unpickled, so the checksum is what
+    stands between the file and code execution: pass `secret` (or set
+    QUERY_CACHE_SECRET) to make it an HMAC-SHA256 nobody without the
+    secret can forge. Without a secret it is a plain SHA-256, which only
+    catches corruption -- then the cache file must be as trusted as the
+    code itself (not writable by anyone else).
+  - Total payload size is bounded by `max_bytes`; least recently used
+    entries are evicted first. The total is kept as a running count, so
+    writes don't re-sum the table.
+  - Entries remember the tables they read so writes invalidate them here
+    too, and expire on wall-clock time.
+  - `hot(limit)` returns the most used entries so a fresh process can
+    preload its in-memory cache (QueryCache.attach_disk(..., warm=True)).
+  - Hits don't write: access times and hit counts are buffered and
+    applied in one transaction every `touch_batch` hits (and before
+    anything that reads them).
+
+Usage:
+    query_cache.attach_disk(DiskCache("query_cache.db"))
+"""
+
+import hashlib
+import hmac
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from rows import PackedRows, record_class
+
+CACHE_VERSION = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key_hash    TEXT PRIMARY KEY,
+    version     TEXT NOT NULL,
+    key         BLOB NOT NULL,
+    payload     BLOB NOT NULL,
+    checksum    TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    expires_at  REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits        INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS entry_tables (
+    key_hash TEXT NOT NULL,
+    tbl      TEXT NOT NULL,
+    PRIMARY KEY (tbl, key_hash)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access);
+CREATE INDEX IF NOT EXISTS entries_hot ON entries (hits DESC);
+"""
+
+
+def _encode(value):
+    """
+    Record classes are generated at runtime and cannot be pickled by
+    reference, so rows are stored as plain tuples plus column names. The
+    kind says whether they came as a list or as PackedRows, so a disk hit
+    returns the same type the miss did.
+    """
+    if isinstance(value, PackedRows):
+        return ("packed", value[0]._fields, [tuple(row) for row in value])
+    if isinstance(value, list) and value and hasattr(value[0], "_fields"):
+        return ("rows", value[0]._fields, [tuple(row) for row in value])
+    if hasattr(value, "_fields"):
+        return ("row", value._fields, tuple(value))
+    return ("raw", None, value)
+
+
+def _decode(kind, names, data):
+    if kind == "packed":
+        return PackedRows.pack([tuple(row) for row in data], names)
+    if kind == "rows":
+        make = record_class(names)._make
+        return [make(row) for row in data]
+    if kind == "row":
+        return record_class(names)._make(data)
+    return data
+
+
+class DiskCache:
+    """Size-bounded, checksummed, versioned result store in a SQLite file."""
+
+    def __init__(self, path="query_cache.db", max_bytes=256 * 1024 * 1024,
+                 namespace="", touch_batch=256, secret=None):
+        self.path = path
+        if secret is None:
+            secret = os.environ.get("QUERY_CACHE_SECRET")
+        if isinstance(secret, str):
+            secret = secret.encode()
+        self._secret = secret
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self._touched = {}      # key_hash -> [last_access, pending hits]
+        self.version = f"{CACHE_VERSION}:{namespace}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False,
+                                     isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.reads = 0
+        self.hits = 0
+        self.writes = 0
+        self.corrupt = 0
+        self.evictions = 0
+        self._purge_other_versions()
+        self._size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _checksum(self, payload):
+        if self._secret:
+            return hmac.new(self._secret, payload, hashlib.sha256).hexdigest()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _verify(self, payload, checksum):
+        return hmac.compare_digest(self._checksum(payload), checksum)
+
+    def _hash(self, key):
+        return hashlib.sha256(
+            self.version.encode() + pickle.dumps(key, protocol=4)).hexdigest()
+
+    def _purge_other_versions(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute(
+                "DELETE FROM entry_tables WHERE key_hash IN "
+                "(SELECT key_hash FROM entries WHERE version != ?)",
+                (self.version,))
+            self._conn.execute("DELETE FROM entries WHERE version != ?",
+                               (self.version,))
+            self._conn.execute("COMMIT")
+
+    def get(self, key):
+        """Return (value, seconds_left) or None."""
+        key_hash = self._hash(key)
+        now = time.time()
+        with self._lock:
+            self.reads += 1
+            row = self._conn.execute(
+                "SELECT payload, checksum, expires_at FROM entries "
+                "WHERE key_hash = ? AND version = ?",
+                (key_hash, self.version)).fetchone()
+            if row is None:
+                return None
+            payload, checksum, expires_at = row
+            if expires_at < now:
+                self._delete(key_hash)
+                return None
+            if not self._verify(payload, checksum):
+                self.corrupt += 1
+                self._delete(key_hash)
+                return None
+            touched = self._touched.setdefault(key_hash, [now, 0])
+            touched[0] = now
+            touched[1] += 1
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touches()
+            self.hits += 1
+        return _decode(*pickle.loads(payload)), expires_at - now
+
+    def _flush_touches(self):
+        """Write buffered access times and hit counts (caller holds the lock)."""
+        if not self._touched:
+            return
+        touched, self._touched = self._touched, {}
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "UPDATE entries SET last_access = MAX(last_access, ?), "
+            "hits = hits + ? WHERE key_hash = ?",
+            [(when, hits, key_hash) for key_hash, (when, hits) in touched.items()])
+        self._conn.execute("COMMIT")
+
+    def set(self, key, value, tables=(), ttl=300.0):
+        payload = pickle.dumps(_encode(value), protocol=4)
+        if len(payload) > self.max_bytes:
+            return False
+        key_hash = self._hash(key)
+        now = time.time()
+        with self._lock:
+            self._flush_touches()
+            size_before = self._size
+            self._conn.execute("BEGIN")
+            try:
+                old = self._conn.execute(
+                    "SELECT size, hits FROM entries WHERE key_hash = ?",
+                    (key_hash,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key_hash, version, key, "
+                    "payload, checksum, size, expires_at, last_access, hits) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key_hash, self.version, pickle.dumps(key, protocol=4),
+                     payload, self._checksum(payload), len(payload),
+                     now + ttl, now, old[1] if old else 0))
+                self._size += len(payload) - (old[0] if old else 0)
+                self._conn.execute(
+                    "DELETE FROM entry_tables WHERE key_hash = ?", (key_hash,))
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO entry_tables (key_hash, tbl) VALUES (?, ?)",
+                    [(key_hash, table) for table in tables])
+                self._evict()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._size = size_before
+                raise
+            self.writes += 1
+        return True
+
+    def _evict(self):
+        if self._size <= self.max_bytes:
+            return
+        for key_hash, size in self._conn.execute(
+                "SELECT key_hash, size FROM entries ORDER BY last_access").fetchall():
+            self._delete(key_hash, size)
+            self.evictions += 1
+            if self._size <= self.max_bytes:
+                break
+
+    def _delete(self, key_hash, size=None):
+        if size is None:
+            row = self._conn.execute(
+                "SELECT size FROM entries WHERE key_hash = ?", (key_hash,)).fetchone()
+            size = row[0] if row else 0
+        self._conn.execute("DELETE FROM entries WHERE key_hash = ?", (key_hash,))
+        self._conn.execute("DELETE FROM entry_tables WHERE key_hash = ?", (key_hash,))
+        self._size -= size
+
+    def delete(self, key):
+        with self._lock:
+            self._touched.pop(self._hash(key), None)
+            self._delete(self._hash(key))
+
+    def invalidate_tables(self, tables):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            for table in tables:
+                for (key_hash,) in self._conn.execute(
+                        "SELECT key_hash FROM entry_tables WHERE tbl = ?",
+                        (table,)).fetchall():
+                    self._delete(key_hash)
+            self._conn.execute("COMMIT")
+
+    def hot(self, limit=None):
+        """
+        Yield (key, value, seconds_left, tables) for live entries, most
+        used first -- the set to preload after a restart.
+        """
+        now = time.time()
+        with self._lock:
+            self._flush_touches()
+            rows = self._conn.execute(
+                "SELECT key_hash, key, payload, checksum, expires_at FROM entries "
+                "WHERE version = ? AND expires_at > ? "
+                "ORDER BY hits DESC, last_access DESC LIMIT ?",
+                (self.version, now, -1 if limit is None else limit)).fetchall()
+            tables = {}
+            for key_hash, tbl in self._conn.execute(
+                    "SELECT key_hash, tbl FROM entry_tables"):
+                tables.setdefault(key_hash, []).append(tbl)
+        for key_hash, key, payload, checksum, expires_at in rows:
+            if not self._verify(payload, checksum):
+                self.corrupt += 1
+                with self._lock:
+                    self._delete(key_hash)
+                continue
+            yield (pickle.loads(key), _decode(*pickle.loads(payload)),
+                   expires_at - now, tables.get(key_hash, ()))
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._conn.execute("DELETE FROM entry_tables")
+            self._size = 0
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.close()
+
+    def stats(self):
+        with self._lock:
+            self._flush_touches()
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "reads": self.reads,
+            "hits": self.hits,
+            "writes": self.writes,
+            "corrupt": self.corrupt,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+hashkeys.py
+
+Hashable keys from call arguments, used by the result cache
+(result_cache.make_key). The asyncio single-flight decorator in
+python-context-async-perations-0x02/async_singleflight.py keeps its own
+copy of freeze(); keep the two in step.
+"""
+
+
+def freeze(value):
+    """Turn call arguments into something hashable for use in a key."""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return frozenset(freeze(v) for v in value)
+    return value
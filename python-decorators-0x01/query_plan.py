@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+query_plan.py
+
+Query-plan capture and index advice for the SQLite helpers.
+
+PlanAdvisor.observe() is called with each statement run through one of
+the hooks below, and its latency; other decorators (cache_query,
+transactional, retry_on_failure) don't report to it. The first time a
+statement fingerprint (query_stats.fingerprint) is seen, its
+`EXPLAIN QUERY PLAN` is captured on the advisor's own connection, and
+full table scans and temp B-trees are flagged. For
+flagged statements, the WHERE/ORDER BY columns are turned into a
+suggested index: equality columns first, then one range column, then
+the sort columns. Suggestions are ranked by the DB time of the
+statements they would help (calls x average latency).
+
+Hooks:
+  - @log_queries(explain=advisor)            (0-log_queries.py)
+  - ExecuteQuery(..., observer=advisor)      (python-context-async-perations-0x02/1-execute.py)
+
+Usage:
+    advisor = PlanAdvisor("users.db")
+    ...
+    for suggestion in advisor.suggestions():
+        print(suggestion["sql"], suggestion["weight_ms"])
+"""
+
+import re
+import sqlite3
+import threading
+
+from query_stats import fingerprint
+
+_EXPLAINABLE = re.compile(r"^\s*(?:SELECT|WITH|UPDATE|DELETE)\b", re.IGNORECASE)
+_WHERE = re.compile(
+    r"\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|$)",
+    re.IGNORECASE | re.DOTALL)
+_ORDER = re.compile(r"\bORDER\s+BY\b(.*?)(?=\bLIMIT\b|$)",
+                    re.IGNORECASE | re.DOTALL)
+_PREDICATE = re.compile(
+    r"(?:\w+\.)?(\w+)(?:\s*(==|<=|>=|<>|!=|=|<|>)|\s+(IS|IN|LIKE|BETWEEN)\b)",
+    re.IGNORECASE)
+# "SCAN t" / "SCAN TABLE t", but not "SCAN CONSTANT ROW" or "SCAN SUBQUERY 1"
+_SCAN = re.compile(r"^SCAN (?:TABLE )?(?!CONSTANT ROW\b|SUBQUERY\b)(\w+)(.*)$")
+_EQUALITY = {"=", "==", "IS", "IN"}
+_RANGE = {"<", ">", "<=", ">=", "BETWEEN", "LIKE"}
+
+
+def parse_predicates(query):
+    """Return ([equality columns], [range columns], [order by columns])."""
+    equality, ranges, order = [], [], []
+    where = _WHERE.search(query)
+    if where:
+        for column, symbol, word in _PREDICATE.findall(where.group(1)):
+            op = (symbol or word).upper()
+            target = equality if op in _EQUALITY else ranges if op in _RANGE else None
+            if target is not None and column not in target:
+                target.append(column)
+    match = _ORDER.search(query)
+    if match:
+        for term in match.group(1).split(","):
+            words = term.split()
+            if words:
+                order.append(words[0].split(".")[-1])
+    return equality, ranges, order
+
+
+class StatementPlan:
+    """Captured plan plus usage numbers for one fingerprint."""
+
+    __slots__ = ("fingerprint", "query", "plan", "full_scans", "temp_btree",
+                 "calls", "total_time", "suggestion", "error")
+
+    def __init__(self, fp, query):
+        self.fingerprint = fp
+        self.query = query
+        self.plan = []
+        self.full_scans = []
+        self.temp_btree = False
+        self.calls = 0
+        self.total_time = 0.0
+        self.suggestion = None
+        self.error = None
+
+    def as_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "total_ms": self.total_time * 1e3,
+            "avg_ms": self.total_time / self.calls * 1e3 if self.calls else 0.0,
+            "plan": [row[-1] for row in self.plan],
+            "full_scans": list(self.full_scans),
+            "temp_btree": self.temp_btree,
+            "suggestion": self.suggestion,
+            "error": self.error,
+        }
+
+
+class PlanAdvisor:
+    """Captures EXPLAIN QUERY PLAN once per fingerprint and suggests indexes."""
+
+    def __init__(self, db_path="users.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._plans = {}
+        self._columns = {}
+
+    def observe(self, query, params=(), seconds=0.0):
+        """Record one execution of `query`; captures its plan on first sight."""
+        if not isinstance(query, str):
+            return
+        fp = fingerprint(query)
+        with self._lock:
+            entry = self._plans.get(fp)
+            if entry is None:
+                entry = self._plans[fp] = StatementPlan(fp, query)
+                if _EXPLAINABLE.match(query):
+                    self._capture(entry, query, params)
+            entry.calls += 1
+            entry.total_time += seconds
+
+    # ------------------------------------------------------------------
+    # plan capture
+    # ------------------------------------------------------------------
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        return self._conn
+
+    def _explain(self, query, params):
+        conn = self._connection()
+        try:
+            return conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()
+        except sqlite3.ProgrammingError:
+            # Parameters unknown (e.g. from log_queries): bind NULLs instead.
+            return conn.execute("EXPLAIN QUERY PLAN " + query,
+                                [None] * query.count("?")).fetchall()
+
+    def _capture(self, entry, query, params):
+        try:
+            entry.plan = self._explain(query, params or ())
+        except sqlite3.Error as e:
+            entry.error = str(e)
+            return
+        for row in entry.plan:
+            detail = row[-1]
+            scan = _SCAN.match(detail)
+            if scan and "USING" not in scan.group(2):
+                entry.full_scans.append(scan.group(1))
+            if "USE TEMP B-TREE" in detail:
+                entry.temp_btree = True
+        if entry.full_scans or entry.temp_btree:
+            entry.suggestion = self._suggest(entry, query)
+
+    def _table_columns(self, table):
+        columns = self._columns.get(table)
+        if columns is None:
+            rows = self._connection().execute(
+                f'PRAGMA table_info("{table}")').fetchall()
+            columns = self._columns[table] = {row[1] for row in rows}
+        return columns
+
+    def _suggest(self, entry, query):
+        equality, ranges, order = parse_predicates(query)
+        tables = entry.full_scans or [
+            m.group(1) for m in (_SCAN.match(r[-1]) for r in entry.plan) if m]
+        for table in tables:
+            known = self._table_columns(table)
+            columns = [c for c in equality if c in known]
+            range_cols = [c for c in ranges if c in known and c not in columns]
+            if range_cols:
+                columns.append(range_cols[0])
+            elif entry.temp_btree:
+                columns += [c for c in order if c in known and c not in columns]
+            if columns:
+                name = f"idx_{table}_{'_'.join(columns)}"
+                return {
+                    "table": table,
+                    "columns": columns,
+                    "sql": f"CREATE INDEX IF NOT EXISTS {name} "
+                           f"ON {table} ({', '.join(columns)})",
+                }
+        return None
+
+    # ------------------------------------------------------------------
+    # reporting
+    # ------------------------------------------------------------------
+    def report(self):
+        """Every observed statement with its plan and flags, heaviest first."""
+        with self._lock:
+            rows = [entry.as_dict() for entry in self._plans.values()]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def suggestions(self):
+        """
+        Suggested indexes, merged across statements and ranked by the DB
+        time (ms) of the statements each would help.
+        """
+        merged = {}
+        for row in self.report():
+            suggestion = row["suggestion"]
+            if not suggestion:
+                continue
+            item = merged.setdefault(suggestion["sql"], dict(
+                suggestion, calls=0, weight_ms=0.0, statements=[]))
+            item["calls"] += row["calls"]
+            item["weight_ms"] += row["total_ms"]
+            item["statements"].append(row["fingerprint"])
+        return sorted(merged.values(), key=lambda s: s["weight_ms"], reverse=True)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
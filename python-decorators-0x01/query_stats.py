@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+query_stats.py
+
+Instrumentation backend for `log_queries` (0-log_queries.py).
+
+The decorated call only times itself and drops a small tuple on a queue;
+a background writer thread does everything else:
+  - groups calls by a normalized statement fingerprint (literals -> ?),
+  - keeps a latency histogram per fingerprint (p50/p95/p99), call and row
+    counts, and a slow-query counter,
+  - writes sampled records (and every slow query) to a sink.
+
+Usage:
+    logger = QueryLogger(sample_rate=0.1, slow_ms=50)
+    ...
+    logger.flush()
+    for row in logger.report():
+        print(row)
+"""
+
+import atexit
+import logging
+import math
+import queue
+import random
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_PARAM_RE = re.compile(r"(?::\w+|\$\d+|\?\d*)")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+logger = logging.getLogger(__name__)
+
+
+def fingerprint(query):
+    """
+    Normalize a SQL statement so calls that differ only in literal values,
+    placeholder style, IN-list length or whitespace group together.
+    """
+    if not isinstance(query, str):
+        return "<no query found>"
+    text = _COMMENT_RE.sub(" ", query)
+    text = _STRING_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _PARAM_RE.sub("?", text)
+    text = _IN_LIST_RE.sub("(?+)", text)
+    text = _SPACE_RE.sub(" ", text).strip().rstrip(";").strip()
+    return text.lower()
+
+
+def count_rows(result):
+    """Best-effort row count for a query function's return value."""
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    # PackedRows, ColumnarResult, ...: sized collections of rows. A single
+    # row (a tuple, record or sqlite3.Row) or a scalar counts as one.
+    if (hasattr(result, "__len__") and not hasattr(result, "_fields")
+            and not isinstance(result, (tuple, sqlite3.Row, str, bytes))):
+        return len(result)
+    return 1
+
+
+class LatencyHistogram:
+    """
+    Log-bucketed latency histogram (~5% relative error), constant memory
+    regardless of how many samples it has seen.
+    """
+
+    _BASE = 1.05
+    _LOG_BASE = math.log(_BASE)
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log(micros) / self._LOG_BASE)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Approximate latency in seconds below which `pct`% of samples fall."""
+        if not self.count:
+            return 0.0
+        rank = math.ceil(self.count * pct / 100.0)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self._BASE ** (index + 1) / 1e6, self.max)
+        return self.max
+
+
+class FingerprintStats:
+    """Aggregated numbers for one statement fingerprint."""
+
+    __slots__ = ("fingerprint", "calls", "rows", "errors", "slow", "latency")
+
+    def __init__(self, fp):
+        self.fingerprint = fp
+        self.calls = 0
+        self.rows = 0
+        self.errors = 0
+        self.slow = 0
+        self.latency = LatencyHistogram()
+
+    def as_dict(self):
+        lat = self.latency
+        return {
+            "fingerprint": self.fingerprint,
+            "calls": self.calls,
+            "rows": self.rows,
+            "errors": self.errors,
+            "slow": self.slow,
+            "total_ms": lat.total * 1e3,
+            "p50_ms": lat.percentile(50) * 1e3,
+            "p95_ms": lat.percentile(95) * 1e3,
+            "p99_ms": lat.percentile(99) * 1e3,
+            "max_ms": lat.max * 1e3,
+        }
+
+
+def print_record(record):
+    """Default sink: one human-readable line per record."""
+    timestamp = datetime.fromtimestamp(record["started"]).strftime(
+        "%Y-%m-%d %H:%M:%S")
+    flag = " SLOW" if record["slow"] else ""
+    status = f" error={record['error']}" if record["error"] else ""
+    print(f"[{timestamp}] Executing query: {record['query']} "
+          f"({record['duration_ms']:.3f} ms, {record['rows']} rows{flag}{status})")
+
+
+class QueryLogger:
+    """
+    Collects query timings off the hot path.
+
+    - sample_rate: fraction of records passed to `sink` (0.0 - 1.0);
+      statistics always include every call.
+    - slow_ms: calls at or above this many milliseconds are counted as slow
+      and always written to `sink`.
+    - sink: callable receiving a record dict, run on the writer thread.
+    """
+
+    _STOP = object()
+
+    def __init__(self, sample_rate=1.0, slow_ms=100.0, sink=print_record,
+                 max_queue=100000):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.sink = sink
+        self._queue = queue.Queue(max_queue)
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self.dropped = 0
+        self.errors = 0    # records the writer thread failed to handle
+
+    def record(self, query, started, duration, rows, error=None,
+               observer=None):
+        """
+        Hand one call to the writer thread; never blocks the caller.
+        `observer.observe(query, (), duration)` (e.g. a query_plan.PlanAdvisor)
+        is called from the writer thread as well.
+        """
+        if self._thread is None:
+            self._start()
+        # Decide here whether the record reaches the sink, so the writer
+        # thread only formats what will actually be written.
+        slow = self.slow_ms is not None and duration * 1e3 >= self.slow_ms
+        sampled = self.sink is not None and (slow or random.random() < self.sample_rate)
+        try:
+            self._queue.put_nowait((query, started, duration, rows, error,
+                                    slow, sampled, observer))
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="query-logger", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is self._STOP:
+                    return
+                self._handle(*item)
+            except Exception:
+                self.errors += 1
+                logger.exception("query logger failed to handle a record")
+            finally:
+                self._queue.task_done()
+
+    def _handle(self, query, started, duration, rows, error, slow, sampled,
+                observer):
+        fp = fingerprint(query)
+        with self._lock:
+            stats = self._stats.get(fp)
+            if stats is None:
+                stats = self._stats[fp] = FingerprintStats(fp)
+            stats.calls += 1
+            stats.rows += rows
+            stats.latency.add(duration)
+            if slow:
+                stats.slow += 1
+            if error is not None:
+                stats.errors += 1
+
+        if sampled:
+            self.sink({
+                "query": query,
+                "fingerprint": fp,
+                "started": started,
+                "duration_ms": duration * 1e3,
+                "rows": rows,
+                "slow": slow,
+                "error": error,
+            })
+        if observer is not None:
+            observer.observe(query, (), duration)
+
+    def flush(self):
+        """Block until every queued record has been processed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Flush and stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def report(self, order_by="total_ms"):
+        """Per-fingerprint summaries, heaviest first (by total DB time)."""
+        with self._lock:
+            rows = [stats.as_dict() for stats in self._stats.values()]
+        return sorted(rows, key=lambda r: r[order_by], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
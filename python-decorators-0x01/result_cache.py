@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+result_cache.py
+
+Bounded query-result cache used by `cache_query` (4-cache_query.py).
+
+  - Keys are the normalized SQL text plus the call parameters.
+  - Entries are evicted least-recently-used once either `max_entries` or
+    `max_bytes` (an estimate of the result size) is exceeded.
+  - Every entry has a time-to-live; expired entries count as misses.
+  - Each entry remembers the tables its query reads, so writers can drop
+    everything that depends on a table with `invalidate_tables()`.
+    `transactional` (2-transactional.py) does this after each commit.
+  - `stats()` exposes hit/miss/eviction counters for sizing.
+  - With `compact=True` (opt-in), list results are stored column-packed
+    (rows.PackedRows) instead of as a list of tuples. Hits then return
+    PackedRows rather than the list a miss returned, and plain tuples come
+    back as records, so only use it where callers index rows generically.
+  - `attach_disk()` adds a persistent tier below memory (disk_cache.py):
+    memory misses fall through to it, stores write through, and the hot
+    set is preloaded at startup.
+"""
+
+import re
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from hashkeys import freeze
+from rows import PackedRows
+
+_TABLE_RE = re.compile(
+    r"\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+[\"'`\[]?(\w+)",
+    re.IGNORECASE,
+)
+_WRITE_RE = re.compile(
+    r"^\s*(?:INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER)\b",
+    re.IGNORECASE,
+)
+
+_MISSING = object()
+
+
+def normalize_query(query):
+    """Collapse whitespace so trivially different spellings share a key."""
+    return " ".join(query.split()) if isinstance(query, str) else query
+
+
+def tables_in(query):
+    """Return the lower-cased table names referenced by a SQL statement."""
+    if not isinstance(query, str):
+        return frozenset()
+    return frozenset(name.lower() for name in _TABLE_RE.findall(query))
+
+
+def is_write(query):
+    """True for statements that modify data or schema."""
+    return isinstance(query, str) and bool(_WRITE_RE.match(query))
+
+
+def make_key(query, args=(), kwargs=None):
+    """Build a cache key from the query text and the remaining call arguments."""
+    return (normalize_query(query), freeze(args), freeze(kwargs or {}))
+
+
+def estimate_size(value):
+    """
+    Rough byte size of a query result (a row, or a list of rows).
+    Good enough to bound memory without walking arbitrary object graphs.
+    """
+    if isinstance(value, PackedRows):
+        return value.nbytes()
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        for row in value:
+            size += sys.getsizeof(row)
+            if isinstance(row, (list, tuple)):
+                size += sum(sys.getsizeof(cell) for cell in row)
+    return size
+
+
+class QueryCache:
+    """Thread-safe LRU + TTL cache for query results."""
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024,
+                 ttl=300.0, compact=False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.compact = compact
+        self.disk = None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (value, expires_at, size, tables)
+        self._by_table = {}             # table -> set(keys)
+        self._generations = {}          # table -> invalidation counter
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.disk_hits = 0
+
+        register_cache(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count=True):
+        """Return the cached value for `key`, or `default` on miss/expiry."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return entry[0]
+            disk = self.disk
+
+        if disk is not None:
+            # A write may invalidate the tables while the disk read runs;
+            # then the row read is stale and must not be served or stored.
+            tables = _cached_tables(key)
+            generation = self.generation(tables)
+            found = disk.get(key)
+            if found is not None and self.generation(tables) == generation:
+                value, ttl = found
+                self._store(key, value, tables, ttl, generation)
+                with self._lock:
+                    self.disk_hits += 1
+                    if count:
+                        self.hits += 1
+                return value
+        if count:
+            with self._lock:
+                self.misses += 1
+        return default
+
+    def attach_disk(self, disk, warm=True, warm_limit=None):
+        """
+        Put `disk` (a disk_cache.DiskCache) below this cache. With `warm`,
+        its most used live entries are loaded into memory right away.
+        """
+        self.disk = disk
+        loaded = 0
+        if warm:
+            for key, value, ttl, tables in disk.hot(warm_limit or self.max_entries):
+                if self._store(key, value, tables, ttl):
+                    loaded += 1
+        return loaded
+
+    def generation(self, tables):
+        """
+        Snapshot of the invalidation counters for `tables`. Pass it back to
+        `set()` so a result computed before a concurrent write is not stored.
+        """
+        with self._lock:
+            return tuple(self._generations.get(t, 0) for t in sorted(tables))
+
+    def set(self, key, value, tables=(), ttl=None, generation=None):
+        """Store `value` under `key`, evicting LRU entries to stay in bounds."""
+        ttl = self.ttl if ttl is None else ttl
+        if generation is None:
+            generation = self.generation(tables)
+        stored = self._store(key, value, tables, ttl, generation)
+        disk = self.disk
+        if stored and disk is not None:
+            disk.set(key, value, tables, ttl)
+            # invalidate_tables() bumps the generation before it clears the
+            # disk tier: if it ran after our memory store, either its disk
+            # clear comes after this write, or we see the new generation
+            # here and take the row back out ourselves.
+            if self.generation(tables) != generation:
+                disk.delete(key)
+        return stored
+
+    def _store(self, key, value, tables, ttl, generation=None):
+        tables = frozenset(tables)
+        if self.compact:
+            value = PackedRows.pack(value)
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            if generation is not None:
+                current = tuple(self._generations.get(t, 0)
+                                for t in sorted(tables))
+                if current != generation:
+                    return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size, tables)
+            self._bytes += size
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+        return True
+
+    def invalidate_tables(self, tables):
+        """Drop every entry whose query reads one of `tables`."""
+        dropped = 0
+        with self._lock:
+            for table in tables:
+                table = table.lower()
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._remove(key)
+                    dropped += 1
+            self.invalidations += dropped
+            disk = self.disk
+        if disk is not None:
+            disk.invalidate_tables(tables)
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        value, _, size, tables = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def stats(self):
+        """Return a snapshot of the cache counters as a plain dict."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "disk_hits": self.disk_hits,
+            }
+
+
+def _cached_tables(key):
+    """Tables read by the query inside a make_key() key."""
+    return tables_in(key[0]) if isinstance(key, tuple) and key else frozenset()
+
+
+# ----------------------------------------------------------------------
+# process-wide invalidation
+# ----------------------------------------------------------------------
+_caches = weakref.WeakSet()
+_caches_lock = threading.Lock()
+
+
+def register_cache(cache):
+    """Make `cache` receive `invalidate_tables()` broadcasts."""
+    with _caches_lock:
+        _caches.add(cache)
+
+
+def invalidate_tables(tables):
+    """Invalidate `tables` in every live QueryCache; returns entries dropped."""
+    tables = frozenset(t.lower() for t in tables)
+    if not tables:
+        return 0
+    with _caches_lock:
+        caches = list(_caches)
+    return sum(cache.invalidate_tables(tables) for cache in caches)
+
+
+def written_tables(statements):
+    """Tables modified by the write statements in `statements`."""
+    tables = set()
+    for statement in statements:
+        if is_write(statement):
+            tables |= tables_in(statement)
+    return tables
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+rows.py
+
+Memory-efficient row representations.
+
+  - record_factory: a sqlite3 row_factory producing instances of a
+    per-query record class (a tuple subclass with `__slots__ = ()` and one
+    property per column). Rows read by name (row.email) or index (row[2])
+    and cost exactly as much as a plain tuple -- no dict per row.
+  - PackedRows: a read-only, array-backed sequence for cached result
+    sets. Integer and float columns live in array.array buffers, text
+    columns in one joined string plus an offsets array; rows are only
+    materialized (as records) when accessed.
+
+Usage:
+    cursor = conn.cursor()
+    cursor.row_factory = record_factory
+    user = cursor.execute("SELECT * FROM users WHERE id = ?", (1,)).fetchone()
+    print(user.name)
+
+    packed = PackedRows.pack(cursor.execute("SELECT * FROM users").fetchall())
+"""
+
+import keyword
+import sys
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+
+_classes = {}           # tuple(column names) -> record class
+_by_description = {}    # id(cursor.description) -> (description, class)
+_new_tuple = tuple.__new__
+
+
+def record_class(names):
+    """Return the (cached) record class for a tuple of column names."""
+    names = tuple(names)
+    cls = _classes.get(names)
+    if cls is None:
+        fields = [
+            name if name.isidentifier() and not keyword.iskeyword(name)
+            else f"_{i}"
+            for i, name in enumerate(names)
+        ]
+        # namedtuple gives a tuple subclass with __slots__ = () and
+        # property accessors; rename=True also fixes duplicate names.
+        cls = namedtuple("Record", fields, rename=True)
+        _classes[names] = cls
+    return cls
+
+
+def record_factory(cursor, row):
+    """sqlite3 row_factory returning slot-less record instances."""
+    description = cursor.description
+    entry = _by_description.get(id(description))
+    if entry is None or entry[0] is not description:
+        cls = record_class(column[0] for column in description)
+        if len(_by_description) > 1024:
+            _by_description.clear()
+        entry = _by_description[id(description)] = (description, cls)
+    return _new_tuple(entry[1], row)
+
+
+class _TextColumn:
+    """Many strings stored as one string plus an offsets array."""
+
+    __slots__ = ("_text", "_offsets")
+
+    def __init__(self, values):
+        self._text = "".join(values)
+        offsets = array("Q", [0])
+        total = 0
+        for value in values:
+            total += len(value)
+            offsets.append(total)
+        self._offsets = offsets
+
+    def __getitem__(self, i):
+        return self._text[self._offsets[i]:self._offsets[i + 1]]
+
+    def nbytes(self):
+        return sys.getsizeof(self._text) + sys.getsizeof(self._offsets)
+
+
+def _pack_column(values):
+    kinds = {type(v) for v in values}
+    if kinds == {int}:
+        try:
+            return array("q", values)
+        except OverflowError:
+            return tuple(values)
+    if kinds == {float}:
+        return array("d", values)
+    if kinds == {str}:
+        return _TextColumn(values)
+    return tuple(values)
+
+
+def _column_nbytes(column):
+    if isinstance(column, _TextColumn):
+        return column.nbytes()
+    size = sys.getsizeof(column)
+    if isinstance(column, tuple):
+        size += sum(sys.getsizeof(v) for v in column)
+    return size
+
+
+class PackedRows(Sequence):
+    """Column-packed, read-only list of rows; items come back as records."""
+
+    __slots__ = ("_cls", "_columns", "_len")
+
+    def __init__(self, cls, columns, length):
+        self._cls = cls
+        self._columns = columns
+        self._len = length
+
+    @classmethod
+    def pack(cls, rows, names=None):
+        """
+        Pack a list of equally sized tuples. Anything else (a single row,
+        None, ragged data) is returned unchanged.
+        """
+        if not isinstance(rows, list) or not rows:
+            return rows
+        width = len(rows[0]) if isinstance(rows[0], tuple) else -1
+        if width <= 0 or any(not isinstance(r, tuple) or len(r) != width
+                             for r in rows):
+            return rows
+        if names is None:
+            names = getattr(rows[0], "_fields", None) or [
+                f"_{i}" for i in range(width)]
+        columns = tuple(_pack_column(list(col)) for col in zip(*rows))
+        return cls(record_class(names), columns, len(rows))
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._len))]
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("PackedRows index out of range")
+        return self._cls._make(col[index] for col in self._columns)
+
+    def __iter__(self):
+        make = self._cls._make
+        columns = self._columns
+        for i in range(self._len):
+            yield make(col[i] for col in columns)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, PackedRows)):
+            return len(self) == len(other) and all(
+                a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def to_list(self):
+        return list(self)
+
+    def nbytes(self):
+        """Approximate memory held by the packed data."""
+        return sys.getsizeof(self) + sum(_column_nbytes(c) for c in self._columns)
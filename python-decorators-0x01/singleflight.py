@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+singleflight.py
+
+Request coalescing for threaded callers.
+
+When several threads ask for the same key at the same time, only the first
+one (the leader) runs the function; the others block until it finishes and
+receive the same result. If the leader raises, every waiter re-raises that
+exception and nothing is remembered, so the next call tries again.
+
+Usage:
+    flight = SingleFlight()
+    rows = flight.do(key, run_query, conn, query)
+"""
+
+import threading
+
+
+class _Call:
+    """One in-flight execution shared by the leader and its waiters."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its outcome."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call `fn(*args, **kwargs)` unless a call for `key` is already running."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+            }
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Unittests for the cache_query decorator (4-cache_query.py)"""
+
+import importlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from db_pool import ConnectionPool
+from disk_cache import DiskCache
+from result_cache import QueryCache
+from rows import record_factory
+
+cq = importlib.import_module("4-cache_query")
+
+
+class TestCacheQuery(unittest.TestCase):
+    """Results served from the cache look like the ones from the database"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, name TEXT)")
+        conn.executemany("INSERT INTO users (name) VALUES (?)",
+                         [("Alice",), ("Bob",)])
+        conn.commit()
+        conn.close()
+        self.pool = ConnectionPool(self.path, size=1)
+        self.cache = QueryCache()
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove(self.path)
+
+    def test_default_cache_is_not_compact(self):
+        """The shared cache keeps results as returned."""
+        self.assertFalse(cq.query_cache.compact)
+
+    def fetcher(self, cache, calls):
+        @cq.with_db_connection(pool=self.pool)
+        @cq.cache_query(cache=cache)
+        def fetch(conn, query):
+            calls.append(query)
+            cursor = conn.cursor()
+            cursor.row_factory = record_factory
+            return cursor.execute(query).fetchall()
+        return fetch
+
+    def assertSameResult(self, hit, miss):
+        self.assertIs(type(hit), type(miss))
+        self.assertIs(type(hit[0]), type(miss[0]))
+        self.assertEqual(hit, miss)
+
+    def test_hit_returns_same_type_as_miss(self):
+        """A hit returns the same type (and rows) as the miss that filled it."""
+        calls = []
+        fetch = self.fetcher(self.cache, calls)
+        miss = fetch(query="SELECT * FROM users")
+        hit = fetch(query="SELECT * FROM users")
+        self.assertEqual(len(calls), 1)
+        self.assertSameResult(hit, miss)
+
+    def test_disk_hit_returns_same_type_as_miss(self):
+        """So does a hit read through from the disk tier or preloaded from it."""
+        fd, disk_path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.addCleanup(os.remove, disk_path)
+        disk = DiskCache(disk_path)
+        self.addCleanup(disk.close)
+        self.cache.attach_disk(disk, warm=False)
+        calls = []
+        miss = self.fetcher(self.cache, calls)(query="SELECT * FROM users")
+
+        for warm in (False, True):
+            cache = QueryCache()
+            self.assertEqual(cache.attach_disk(disk, warm=warm), int(warm))
+            hit = self.fetcher(cache, calls)(query="SELECT * FROM users")
+            self.assertEqual(len(calls), 1)
+            self.assertSameResult(hit, miss)
+        self.assertIsInstance(miss, list)
+
+
+if __name__ == "__main__":
+    unittest.main()
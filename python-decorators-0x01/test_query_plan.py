@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Unittests for query_plan.parse_predicates and plan parsing"""
+
+import os
+import sqlite3
+import tempfile
+import unittest
+from parameterized import parameterized
+
+from query_plan import PlanAdvisor, parse_predicates
+
+
+class TestParsePredicates(unittest.TestCase):
+    """WHERE / ORDER BY column extraction"""
+
+    @parameterized.expand([
+        ("SELECT * FROM users WHERE id = ?", ["id"], []),
+        ("SELECT * FROM users WHERE id=?", ["id"], []),
+        ("SELECT * FROM users WHERE age>?", [], ["age"]),
+        ("SELECT * FROM users WHERE age>=? AND name=?", ["name"], ["age"]),
+        ("SELECT * FROM users u WHERE u.email == ? AND u.age<>?", ["email"], []),
+        ("SELECT * FROM users WHERE name LIKE ? AND id IN (?, ?)", ["id"], ["name"]),
+        ("SELECT * FROM users WHERE age BETWEEN ? AND ?", [], ["age"]),
+        ("SELECT * FROM users WHERE login IS NULL", ["login"], []),
+    ])
+    def test_parse_predicates(self, query, equality, ranges):
+        """Operators are found with or without surrounding whitespace."""
+        found_equality, found_ranges, _ = parse_predicates(query)
+        self.assertEqual(found_equality, equality)
+        self.assertEqual(found_ranges, ranges)
+
+    def test_order_by(self):
+        """ORDER BY columns are returned without direction or table prefix."""
+        self.assertEqual(
+            parse_predicates("SELECT * FROM users ORDER BY u.age DESC, name")[2],
+            ["age", "name"])
+
+
+class TestPlanAdvisor(unittest.TestCase):
+    """Full-scan detection from EXPLAIN QUERY PLAN"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, age INTEGER)")
+        conn.close()
+        self.advisor = PlanAdvisor(self.path)
+
+    def tearDown(self):
+        self.advisor.close()
+        os.remove(self.path)
+
+    def test_constant_row_is_not_a_table_scan(self):
+        """SCAN CONSTANT ROW is not reported as a scan of table CONSTANT."""
+        self.advisor.observe("SELECT 1")
+        self.assertEqual(self.advisor.report()[0]["full_scans"], [])
+
+    def test_full_scan_suggests_index(self):
+        """A filtered full scan yields an index on the range column."""
+        self.advisor.observe("SELECT * FROM users WHERE age>?", (40,))
+        report = self.advisor.report()[0]
+        self.assertEqual(report["full_scans"], ["users"])
+        self.assertEqual(report["suggestion"]["columns"], ["age"])
+
+
+if __name__ == "__main__":
+    unittest.main()
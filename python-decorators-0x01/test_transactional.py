@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Unittests for the transactional decorator (2-transactional.py)"""
+
+import importlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from db_pool import ConnectionPool, TrackedConnection
+
+tx = importlib.import_module("2-transactional")
+
+
+class TestTransactional(unittest.TestCase):
+    """Nesting behavior of @transactional"""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        conn.execute("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+        conn.execute("INSERT INTO users VALUES (1, 'old@example.com')")
+        conn.commit()
+        conn.close()
+        self.pool = ConnectionPool(self.path, size=1)
+
+    def tearDown(self):
+        self.pool.close()
+        os.remove(self.path)
+
+    def email(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            return conn.execute("SELECT email FROM users WHERE id = 1").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_outer_failure_rolls_back_nested_write(self):
+        """A nested call's released savepoint is undone when the outer call raises."""
+        @tx.transactional
+        def inner(conn):
+            conn.execute("UPDATE users SET email = 'new@example.com' WHERE id = 1")
+
+        @tx.with_db_connection(pool=self.pool)
+        @tx.transactional
+        def outer(conn):
+            inner(conn)
+            raise RuntimeError("outer failed")
+
+        with self.assertRaises(RuntimeError):
+            outer()
+        self.assertEqual(self.email(), "old@example.com")
+
+    def test_nested_failure_keeps_outer_work(self):
+        """A failing nested call rolls back only its own savepoint."""
+        @tx.transactional
+        def inner(conn):
+            conn.execute("UPDATE users SET email = 'inner@example.com' WHERE id = 1")
+            raise ValueError("inner failed")
+
+        @tx.with_db_connection(pool=self.pool)
+        @tx.transactional
+        def outer(conn):
+            conn.execute("UPDATE users SET email = 'outer@example.com' WHERE id = 1")
+            with self.assertRaises(ValueError):
+                inner(conn)
+
+        outer()
+        self.assertEqual(self.email(), "outer@example.com")
+
+    def test_depth_cleared_after_error(self):
+        """No nesting state is left behind for the connection."""
+        @tx.with_db_connection(pool=self.pool)
+        @tx.transactional
+        def fails(conn):
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            fails()
+        with self.pool.connection() as conn:
+            self.assertNotIn(conn, tx._depth)
+
+    def test_plain_connection(self):
+        """Connections not opened by the pool work too."""
+        @tx.transactional
+        def write(conn):
+            conn.execute("UPDATE users SET email = 'plain@example.com' WHERE id = 1")
+
+        conn = sqlite3.connect(self.path)
+        try:
+            write(conn)
+        finally:
+            conn.close()
+        self.assertEqual(self.email(), "plain@example.com")
+        self.assertEqual(tx._plain_depth, {})
+
+    def test_keeps_callers_trace_callback(self):
+        """The caller's trace callback sees the statements and is put back."""
+        @tx.transactional
+        def write(conn):
+            conn.execute("UPDATE users SET email = 'traced@example.com' WHERE id = 1")
+
+        seen = []
+        conn = sqlite3.connect(self.path, factory=TrackedConnection)
+        try:
+            conn.set_trace_callback(seen.append)
+            write(conn)
+            self.assertEqual(conn.trace_callback, seen.append)
+            conn.execute("SELECT 1")
+        finally:
+            conn.close()
+        self.assertTrue(any(sql.startswith("UPDATE") for sql in seen))
+        self.assertEqual(seen[-1], "SELECT 1")
+
+
+class TestGroupCommit(unittest.TestCase):
+    """GroupCommit fails queued calls instead of hanging when it can't run"""
+
+    def test_connect_failure_fails_calls(self):
+        group = tx.GroupCommit(os.path.join(tempfile.mkdtemp(), "missing", "x.db"))
+        future = group.submit(lambda conn: None)
+        with self.assertRaises(RuntimeError):
+            future.result(timeout=5)
+        with self.assertRaises(RuntimeError):
+            group.submit(lambda conn: None)
+        group.close()
+
+
+if __name__ == "__main__":
+    unittest.main()